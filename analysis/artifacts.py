@@ -0,0 +1,243 @@
+"""
+Writing the tables and data files produced by the analysis.
+
+An ArtifactSink writes LaTeX tables (to ./Tables), JSON and XLSX files (to ./Data), and figures (to ./Figures).
+Inside `with sink.batch():`, outputs are collected and only written when the block ends,
+rendered in a thread pool. Either way:
+    - files are written atomically (to a temporary file that then replaces the old one),
+    - a file is not rewritten if its content is unchanged since the last run
+      (content hashes are kept in .artifacts.json, so unchanged XLSX files are not even rendered),
+    - with `bundle='results.xlsx'` (or 'results.parquet'), everything but the figures goes into a single file
+      instead: one sheet per output, or one table with an `artifact` column.
+"""
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import hashlib
+import io
+import json
+import os
+import threading
+
+import pandas as pd
+from tabulate import tabulate
+
+MANIFEST = ".artifacts.json"
+
+Artifact = namedtuple('Artifact', ['path', 'kind', 'content'])
+
+
+def render(artifact):
+    "The bytes of the file for an artifact."
+    if artifact.kind == 'latex':
+        rows, headers = artifact.content
+        return tabulate(rows, headers=headers, tablefmt='latex_booktabs').encode('utf-8')
+    elif artifact.kind == 'json':
+        return json.dumps(artifact.content, indent=2).encode('utf-8')
+    elif artifact.kind == 'xlsx':
+        buffer = io.BytesIO()
+        artifact.content.to_excel(buffer, index=False)
+        return buffer.getvalue()
+    elif artifact.kind == 'figure':
+        buffer = io.BytesIO()
+        file_format = os.path.splitext(artifact.path)[1][1:].lower()
+        # Leave out the creation date, so that an unchanged PDF has the same bytes
+        metadata = {'CreationDate': None} if file_format == 'pdf' else None
+        artifact.content.savefig(buffer, format=file_format, metadata=metadata)
+        return buffer.getvalue()
+    raise ValueError(f"Unknown kind of artifact: {artifact.kind}")
+
+
+def content_hash(artifact, data=None):
+    """
+    Hash of the content of an artifact, given the rendered bytes `data` (rendered here if not given).
+    XLSX files embed the time they were written, so data frames are hashed as CSV instead.
+    """
+    if artifact.kind == 'xlsx':
+        data = artifact.content.to_csv(index=False).encode('utf-8')
+    elif data is None:
+        data = render(artifact)
+    return hashlib.sha1(data).hexdigest()
+
+
+def to_frame(artifact):
+    "An artifact as a DataFrame, for bundles."
+    if artifact.kind == 'latex':
+        rows, headers = artifact.content
+        return pd.DataFrame(list(rows), columns=list(headers))
+    elif artifact.kind == 'json':
+        content = artifact.content
+        if isinstance(content, dict):
+            return pd.DataFrame(list(content.items()), columns=['key', 'value'])
+        return pd.DataFrame(content)
+    return artifact.content
+
+
+def atomic_write(path, data):
+    "Write `data` to `path` through a temporary file, so readers never see a partly written file."
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class ArtifactSink(object):
+    "Where the tables and data files of the analysis are written."
+
+    def __init__(self, root='.', tables_dir='Tables', data_dir='Data', figures_dir='Figures', workers=4, bundle=None):
+        """
+        Inputs -
+            root - directory the output folders are in
+            tables_dir, data_dir, figures_dir - folders for LaTeX tables, for JSON and XLSX files, and for figures
+            workers - number of threads used to render and write a batch
+            bundle - if given, the path (relative to root) of a single .xlsx or .parquet file to write
+                     everything but the figures to
+        """
+        self.root = root
+        self.tables_dir = tables_dir
+        self.data_dir = data_dir
+        self.figures_dir = figures_dir
+        self.workers = workers
+        self.bundle = bundle
+        self.pending = None
+        self._manifest = None
+        self._lock = threading.Lock()
+
+    # Adding outputs
+
+    def table(self, rows, headers, filename):
+        "A LaTeX table, written to the tables folder."
+        self.add(Artifact(os.path.join(self.tables_dir, filename), 'latex', (list(rows), list(headers))))
+
+    def json(self, content, filename):
+        "A JSON file, written to the data folder."
+        self.add(Artifact(os.path.join(self.data_dir, filename), 'json', content))
+
+    def frame(self, df, filename):
+        "A DataFrame, written to the data folder as an XLSX file."
+        self.add(Artifact(os.path.join(self.data_dir, filename), 'xlsx', df))
+
+    def figure(self, figure, filename):
+        "A matplotlib figure, written to the figures folder in the format given by the extension of `filename`."
+        self.add(Artifact(os.path.join(self.figures_dir, filename), 'figure', figure))
+
+    def add(self, artifact):
+        if self.pending is not None:
+            self.pending.append(artifact)
+        else:
+            self.write([artifact])
+
+    @contextmanager
+    def batch(self):
+        "Collect all outputs, and write them when the block ends."
+        self.pending = []
+        try:
+            yield self
+        finally:
+            artifacts, self.pending = self.pending, None
+        self.write(artifacts)
+
+    # Writing
+
+    def manifest_path(self):
+        return os.path.join(self.root, MANIFEST)
+
+    def manifest(self):
+        "Content hash, size and modification time of every file written before."
+        if self._manifest is None:
+            try:
+                with open(self.manifest_path()) as f:
+                    self._manifest = json.load(f)
+            except (OSError, ValueError):
+                self._manifest = {}
+        return self._manifest
+
+    def unchanged(self, path, digest):
+        "Whether the file at `path` was written with this content, and has not been touched since."
+        entry = self.manifest().get(path)
+        if entry is None or entry['sha1'] != digest:
+            return False
+        try:
+            stat = os.stat(os.path.join(self.root, path))
+        except OSError:
+            return False
+        return entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns
+
+    def write_file(self, artifact):
+        "Render and write one artifact, unless its file is up to date. Returns whether it was written."
+        # XLSX files are only rendered if they changed; the other kinds are rendered once, and hashed and written
+        data = None if artifact.kind == 'xlsx' else render(artifact)
+        digest = content_hash(artifact, data)
+        if self.unchanged(artifact.path, digest):
+            return False
+        path = os.path.join(self.root, artifact.path)
+        atomic_write(path, render(artifact) if data is None else data)
+        stat = os.stat(path)
+        with self._lock:
+            self.manifest()[artifact.path] = dict(sha1=digest, size=stat.st_size, mtime=stat.st_mtime_ns)
+        return True
+
+    def write(self, artifacts):
+        "Write artifacts (to separate files, or to the bundle). Returns the number of files written."
+        if not artifacts:
+            return 0
+        if self.bundle is not None:
+            figures = [artifact for artifact in artifacts if artifact.kind == 'figure']
+            others = [artifact for artifact in artifacts if artifact.kind != 'figure']
+            return (self.write_bundle(others) if others else 0) + self.write_files(figures)
+        return self.write_files(artifacts)
+
+    def write_files(self, artifacts):
+        "Write artifacts to separate files. Returns the number of files written."
+        if not artifacts:
+            return 0
+        # Load the manifest before the threads share it, so that they all record their files in the same one
+        self.manifest()
+        if len(artifacts) == 1 or self.workers == 1:
+            written = [self.write_file(artifact) for artifact in artifacts]
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                written = list(executor.map(self.write_file, artifacts))
+        if any(written):
+            self.save_manifest()
+        return sum(written)
+
+    def write_bundle(self, artifacts):
+        "Write all artifacts to a single XLSX file (one sheet each) or Parquet file (with an artifact column)."
+        path = os.path.join(self.root, self.bundle)
+        if self.bundle.lower().endswith('.parquet'):
+            frames = [to_frame(artifact).astype(str).assign(artifact=artifact.path) for artifact in artifacts]
+            data = io.BytesIO()
+            pd.concat(frames, ignore_index=True).to_parquet(data, index=False)
+        else:
+            data = io.BytesIO()
+            sheet_names = set()
+            with pd.ExcelWriter(data) as writer:
+                for artifact in artifacts:
+                    sheet_name = self.sheet_name(artifact.path, sheet_names)
+                    to_frame(artifact).to_excel(writer, sheet_name=sheet_name, index=False)
+        atomic_write(path, data.getvalue())
+        return 1
+
+    @staticmethod
+    def sheet_name(path, used):
+        "A unique sheet name (at most 31 characters) for the file at `path`."
+        stem = os.path.splitext(os.path.basename(path))[0][:31]
+        name, i = stem, 1
+        while name in used:
+            suffix = f"~{i}"
+            name, i = stem[:31 - len(suffix)] + suffix, i + 1
+        used.add(name)
+        return name
+
+    def save_manifest(self):
+        try:
+            atomic_write(self.manifest_path(), json.dumps(self.manifest(), indent=2, sort_keys=True).encode('utf-8'))
+        except OSError:
+            # The manifest only lets unchanged files be skipped; not being able to write it is harmless.
+            pass
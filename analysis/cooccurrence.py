@@ -0,0 +1,129 @@
+"""
+Sparse co-occurrence counts between the values of two columns.
+
+A Cooccurrence holds a sparse (scipy.sparse CSR) matrix of counts, with integer-coded
+vocabularies for the row values (e.g. tasks) and the column values (e.g. criteria).
+Values are coded in order of first occurrence, and ties in top-k lists are broken by
+the order in which each pair first occurred, so tables come out in the same order as
+the nested-dictionary counters they replace.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+class Cooccurrence(object):
+    "Sparse matrix of how often each row value occurred together with each column value."
+
+    def __init__(self, counts, rows, columns, first_seen=None):
+        """
+        Inputs -
+            counts - sparse matrix of counts (rows x columns)
+            rows, columns - the values for the rows and columns of the matrix
+            first_seen - sparse matrix with the same structure as `counts`, with the (1-based) rank
+                         of the first occurrence of each pair, used to order ties.
+                         By default, ties are in the order of `columns` (never by count).
+        """
+        self.counts = sparse.csr_matrix(counts)
+        self.counts.sort_indices()
+        self.rows = list(rows)
+        self.columns = list(columns)
+        self.row_codes = {value: i for i, value in enumerate(self.rows)}
+        self.column_codes = {value: i for i, value in enumerate(self.columns)}
+        if first_seen is None:
+            # Rank the pairs of each row by column, the order of first occurrence of the column values
+            first_seen = self.counts.copy()
+            first_seen.data = np.arange(1, first_seen.nnz + 1)
+        self.first_seen = sparse.csr_matrix(first_seen)
+        self.first_seen.sort_indices()
+
+    @classmethod
+    def from_pairs(cls, row_values, column_values):
+        "Count the (row value, column value) pairs, given as two aligned sequences."
+        row_codes, rows = pd.factorize(pd.Series(row_values, dtype=object), sort=False)
+        column_codes, columns = pd.factorize(pd.Series(column_values, dtype=object), sort=False)
+        pairs = pd.DataFrame({'row': row_codes, 'column': column_codes})
+        # Distinct pairs in order of first occurrence, with their counts
+        grouped = pairs.groupby(['row', 'column'], sort=False).size()
+        row_index = grouped.index.get_level_values('row').to_numpy()
+        column_index = grouped.index.get_level_values('column').to_numpy()
+        shape = (len(rows), len(columns))
+        counts = sparse.csr_matrix((grouped.to_numpy(), (row_index, column_index)), shape=shape)
+        first_seen = sparse.csr_matrix((np.arange(1, len(grouped) + 1), (row_index, column_index)), shape=shape)
+        return cls(counts, rows, columns, first_seen)
+
+    @classmethod
+    def from_long(cls, left, right):
+        """
+        Count the values that occur in the same row of the index.
+        Inputs -
+            left, right - long-form (paper, row, value) tables, e.g. produced by explode_contents()
+        """
+        pairs = left.merge(right, on=['paper', 'row'], suffixes=('_left', '_right'))
+        return cls.from_pairs(pairs['value_left'], pairs['value_right'])
+
+    # Marginals
+
+    def row_totals(self):
+        "Total count for each row value."
+        return np.asarray(self.counts.sum(axis=1)).ravel()
+
+    def column_totals(self):
+        "Total count for each column value."
+        return np.asarray(self.counts.sum(axis=0)).ravel()
+
+    def total(self):
+        return self.counts.sum()
+
+    # Normalisations
+
+    def conditional_probability(self, given='row'):
+        """
+        Sparse matrix of P(column value | row value) (given='row'),
+        or P(row value | column value) (given='column').
+        """
+        if given == 'row':
+            totals = self.row_totals()
+            return sparse.diags(1 / np.where(totals > 0, totals, 1)) @ self.counts
+        elif given == 'column':
+            totals = self.column_totals()
+            return self.counts @ sparse.diags(1 / np.where(totals > 0, totals, 1))
+        raise ValueError(f"Unknown condition: {given}")
+
+    def pmi(self):
+        "Sparse matrix of the pointwise mutual information of every pair that occurs: log(p(x, y) / (p(x) p(y)))."
+        coo = self.counts.tocoo()
+        row_totals, column_totals = self.row_totals(), self.column_totals()
+        values = np.log(coo.data * self.total() / (row_totals[coo.row] * column_totals[coo.col]))
+        return sparse.csr_matrix((values, (coo.row, coo.col)), shape=self.counts.shape)
+
+    # Lookups
+
+    def count(self, row_value, column_value):
+        return self.counts[self.row_codes[row_value], self.column_codes[column_value]]
+
+    def top_k(self, row_value, k=None):
+        "The `k` (default: all) most frequent column values for `row_value`, as (value, count) pairs."
+        i = self.row_codes[row_value]
+        start, end = self.counts.indptr[i], self.counts.indptr[i + 1]
+        columns = self.counts.indices[start:end]
+        counts = self.counts.data[start:end]
+        # Highest count first; ties in the order in which the pairs were first seen
+        first_seen = self.first_seen.data[start:end]
+        order = np.lexsort((first_seen, -counts))[:k]
+        return [(self.columns[columns[j]], int(counts[j])) for j in order]
+
+    def to_rows(self, row_order=None, k=None):
+        """
+        Flatten to [row value, column value, count] rows, with the top `k` column values of each row value.
+        Row values are listed in `row_order` (values that do not occur are skipped), or in order of first occurrence.
+        """
+        row_order = self.rows if row_order is None else [value for value in row_order if value in self.row_codes]
+        return [[row_value, column_value, count]
+                for row_value in row_order
+                for column_value, count in self.top_k(row_value, k)]
+
+    def to_frame(self, columns=('row', 'column', 'count'), row_order=None, k=None):
+        "The same as to_rows(), as a DataFrame (e.g. for Sankey diagrams)."
+        return pd.DataFrame(self.to_rows(row_order, k), columns=list(columns))
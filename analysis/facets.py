@@ -0,0 +1,144 @@
+"""
+Inverted indexes over the paper index, for ad-hoc slices of the data.
+
+For every facet (column), a FacetIndex keeps a posting for each value: the set of papers
+with at least one row that has that value. Postings are stored as bitsets (Python integers,
+one bit per paper), so a query like "data-to-text papers after 2015 with Likert scales" is
+answered by intersecting a few integers instead of scanning every row:
+
+    facets = FacetIndex(get_index('terminology_complete.xlsx'))
+    papers = facets.query(system_task='data-to-text generation',
+                          pub_year=lambda year: year > 2015,
+                          op_instrument_type='likert scale')
+    facets.count('criterion_paraphrase', papers)
+"""
+
+from collections import Counter
+
+import numpy as np
+
+from full_stats import split_statistic_modified
+from longform import index_to_frame, explode
+
+# How the values of each facet are parsed (see longform.explode()):
+#   'contents' - multi-valued cells, lowercased
+#   'paraphrase' - multi-valued cells with numbering removed
+#   'value' - the cell value as it is
+#   or a function that turns a cell into a list of values, as for the statistics
+FACETS = {'pub_year': 'value',
+          'pub_venue': 'value',
+          'annotator': 'value',
+          'system_language': 'contents',
+          'system_input': 'contents',
+          'system_output': 'contents',
+          'system_task': 'contents',
+          'op_form': 'contents',
+          'op_data_type': 'contents',
+          'op_instrument_type': 'contents',
+          'op_statistics': split_statistic_modified,
+          'criterion_paraphrase': 'paraphrase'}
+
+
+def _bitset(ordinals, size):
+    "Bitset (a Python integer) with the bits at `ordinals` set, built in one go."
+    bits = np.zeros(size, dtype=bool)
+    bits[ordinals] = True
+    return int.from_bytes(np.packbits(bits, bitorder='little').tobytes(), 'little')
+
+
+class FacetIndex(object):
+    """
+    Value -> papers postings for each facet of the paper index.
+    A paper is in the posting of a value if any of its rows has that value.
+    """
+
+    def __init__(self, index, facets=None):
+        self.facets = dict(FACETS if facets is None else facets)
+        self.papers = list(index)
+        self.all_papers = (1 << len(self.papers)) - 1
+        self.postings = {}
+        frame = index_to_frame(index)
+        ordinals = {paper: i for i, paper in enumerate(self.papers)}
+        for facet, parser in self.facets.items():
+            long = explode(frame, facet, parser)
+            papers = long['paper'].map(ordinals).to_numpy()
+            groups = long.groupby('value', sort=False).indices
+            self.postings[facet] = {value: _bitset(papers[rows], len(self.papers))
+                                    for value, rows in groups.items()}
+        # Values can be looked up regardless of case.
+        self._folded = {facet: {str(value).casefold(): value for value in postings}
+                        for facet, postings in self.postings.items()}
+
+    def values(self, facet):
+        "All values of a facet."
+        return list(self.postings[facet])
+
+    def posting(self, facet, value):
+        "Bitset of the papers with `value` for `facet` (case-insensitive)."
+        postings = self.postings[facet]
+        if value not in postings:
+            value = self._folded[facet].get(str(value).casefold(), value)
+        return postings.get(value, 0)
+
+    def bits(self, facet, condition):
+        """
+        Bitset of the papers that match a condition on one facet. The condition is either
+          - a value,
+          - a list, tuple or set of values (papers with any of them), or
+          - a function that is called with each value of the facet (papers with any value for which it is true).
+        """
+        if callable(condition):
+            matches = [value for value in self.postings[facet] if condition(value)]
+        elif isinstance(condition, (list, tuple, set, frozenset)):
+            matches = condition
+        else:
+            matches = [condition]
+        bits = 0
+        for value in matches:
+            bits |= self.posting(facet, value)
+        return bits
+
+    def query_bits(self, without=None, **conditions):
+        "Bitset of the papers that match all `conditions`, and none of the conditions in `without`."
+        bits = self.all_papers
+        for facet, condition in conditions.items():
+            bits &= self.bits(facet, condition)
+            if not bits:
+                break
+        for facet, condition in (without or {}).items():
+            bits &= ~self.bits(facet, condition)
+        return bits
+
+    def query(self, without=None, **conditions):
+        "Keys of the papers that match all `conditions` (and none in `without`), in index order."
+        return self.keys(self.query_bits(without, **conditions))
+
+    def keys(self, bits):
+        "Convert a bitset to a list of paper keys."
+        keys = []
+        while bits:
+            lowest = bits & -bits
+            keys.append(self.papers[lowest.bit_length() - 1])
+            bits ^= lowest
+        return keys
+
+    def to_bits(self, papers):
+        "Convert paper keys (or a bitset) to a bitset."
+        if isinstance(papers, int):
+            return papers
+        wanted = set(papers)
+        return sum(1 << i for i, paper in enumerate(self.papers) if paper in wanted)
+
+    def count(self, facet, papers=None):
+        "Number of papers with each value of `facet`, among `papers` (keys or a bitset; default: all papers)."
+        bits = self.all_papers if papers is None else self.to_bits(papers)
+        counts = Counter()
+        for value, posting in self.postings[facet].items():
+            n = bin(posting & bits).count('1')
+            if n:
+                counts[value] = n
+        return counts
+
+    def subindex(self, index, without=None, **conditions):
+        "The part of the paper index for the papers that match the query, for use with the functions in full_stats."
+        return {key: index[key] for key in self.query(without, **conditions)}
@@ -1,16 +1,18 @@
 # Local
 from sheetreader import get_index
+from longform import long_form, explode_contents, year_crosstab
+from cooccurrence import Cooccurrence
+from artifacts import ArtifactSink
+from normalise import TermNormaliser
 
 # Internal
-from collections import Counter, defaultdict
+from collections import Counter, defaultdict, namedtuple
+import heapq
 import json
-import operator
 import os
-import re
 from itertools import combinations, cycle
 
 # External
-from tabulate import tabulate
 from matplotlib import pyplot as plt
 import seaborn as sns
 import pandas as pd
@@ -19,17 +21,23 @@ import pandas as pd
 ################################################################################
 # Output
 
+# Tables go to ./Tables, JSON and XLSX files to ./Data, and figures to ./Figures. Unchanged files are not rewritten.
+ARTIFACTS = ArtifactSink('.')
+
+
 def write_json(object, filename):
     "Write object to a JSON file."
-    with open(f'./Data/{filename}', 'w') as f:
-        json.dump(object, f, indent=2)
+    ARTIFACTS.json(object, filename)
 
 
 def write_table(rows, headers, filename):
     "Write LaTeX table to a file."
-    table = tabulate(rows, headers=headers, tablefmt='latex_booktabs')
-    with open(f'./Tables/{filename}', 'w') as f:
-        f.write(table)
+    ARTIFACTS.table(rows, headers, filename)
+
+
+def write_excel(df, filename):
+    "Write a DataFrame to an XLSX file."
+    ARTIFACTS.frame(df, filename)
 
 
 def write_frequency_table(counter, headers, filename):
@@ -39,6 +47,42 @@ def write_frequency_table(counter, headers, filename):
                 filename=filename)
 
 
+################################################################################
+# Normalisation
+# These normalisers are shared by all of the counters below.
+# Their patterns are compiled once, and they remember the terms they have already seen.
+
+NUMBERING_PATTERN = r'(\d*\/*\d*\w\.) '
+NUMBERING_PATTERN_NO_SPACE = r'(\d*\/*\d*\w\.)'
+
+# Statistics, e.g. 'SD' -> 'standard deviation'. The rules are listed in statistics_terms.json.
+STATISTICS_NORMALISER = TermNormaliser.from_file("statistics_terms.json")
+
+# Criterion paraphrases, as counted by count_contents_paraphase().
+PARAPHRASE_NORMALISER = TermNormaliser(substitutions=[("-", ""),
+                                                      (NUMBERING_PATTERN, " ")])
+
+# Criterion paraphrases, as used in task_2_criterion_standardized().
+STANDARDISED_CRITERION_NORMALISER = TermNormaliser(substitutions=[("-", ""),
+                                                                  (NUMBERING_PATTERN, " "),
+                                                                  (r"\.", ""),
+                                                                  (r"Multiple \(list all\):", "")])
+
+# Criterion paraphrases, as used in criterion_2_paraphrased().
+VERBATIM_TO_PARAPHRASE_NORMALISER = TermNormaliser(substitutions=[(r"multiple \(list all\)", ""),
+                                                                  ("-", ""),
+                                                                  (NUMBERING_PATTERN_NO_SPACE, " "),
+                                                                  (r"\.", ""),
+                                                                  (":", "")],
+                                                   lowercase=True)
+
+# Criterion paraphrases, as used in the modified confusion tables.
+CONFUSION_PARAPHRASE_NORMALISER = TermNormaliser(substitutions=[("-", ""),
+                                                                (NUMBERING_PATTERN_NO_SPACE, " "),
+                                                                (r"\.", ""),
+                                                                (",", "COMMA")])
+
+
 ################################################################################
 # Statistics
 
@@ -59,146 +103,71 @@ def write_frequency_table(counter, headers, filename):
 #   - Languages
 #   - Statistics used
 
+def split_statistic(value):
+    "Split a single statistics cell on commas (or semicolons, if there are no commas)."
+    value = value.lower()
+    if value != "" and value != "none given":
+        split_crit = ""
+        if "," in value:
+            split_crit = ","
+        else:
+            split_crit = ";"
+        items = value.split(split_crit)
+        return [item.strip() for item in items]
+    return []
+
+
+stats_normalisation_dict = STATISTICS_NORMALISER.synonyms
+
+
+def normalise_statistics_terms(term: str):
+    return [STATISTICS_NORMALISER(term)]
+
+
+def split_statistic_modified(value):
+    "Split a single statistics cell, and normalise the names of the statistics."
+    normalised_items = []
+    if value != "" and value != "none given":
+        split_crit = ""
+        if "," in value:
+            split_crit = ","
+        else:
+            split_crit = ";"
+        items = value.split(split_crit)
+        for item in items:
+            normalised_items.append(STATISTICS_NORMALISER(item.strip()))
+    return normalised_items
+
+
 def unique_count_contents(index, key):
     # Counts unique number of instances a per paper level:
-    unique_counter = Counter()
-    for paper, rows in index.items():
-        for row in rows:
-            value_counter = count_contents({paper: [row]}, key)
-            for value_key in value_counter.keys():
-                if value_key in unique_counter:
-                    unique_counter[value_key] = unique_counter[value_key] + 1
-                else:
-                    unique_counter[value_key] = 1
-    return unique_counter
+    return count_many(index, {key: CounterSpec(key, 'unique')})[key]
 
 
 def count_all_contents(index, key):
     # Counts all instances for a given column key:
-    all_counter = Counter()
-    for paper, rows in index.items():
-        for row in rows:
-            value_counter = count_contents({paper: [row]}, key, True)
-            for value_key, count in value_counter.items():
-                if value_key in all_counter:
-                    all_counter[value_key] = all_counter[value_key] + count
-                else:
-                    all_counter[value_key] = count
-    return all_counter
+    return count_many(index, {key: CounterSpec(key, 'all')})[key]
 
 
 def count_contents(index, key, count_blank=False):
     # Counts the number of times that values occur in a particular column:
-    value_counter = Counter()
-    for paper, rows in index.items():
-        value = rows[0][key]
-        value = value.lower()
-        if 'Multiple' in value or 'multiple' in value:
-            if key != "system_output":
-                value = " ".join(value.split(":")[1:])
-                items = value.strip().split(', ')
-                value_counter.update([item.strip() for item in items])
-            elif key == "system_output":
-                value = value.replace("multiple (list all):", "").strip()
-                items = value.strip().split(', ')
-                value_counter.update([item.strip() for item in items])
-
-        elif value not in {"", "none given", "not given", "blank"}:
-            value = value.strip()
-            value_counter[value] += 1
-        elif value in {"", "none given", "not given", "blank"} and count_blank:
-            value = "None Given/Blank"
-            value_counter[value] += 1
-    return value_counter
+    mode = 'first_inc_blank' if count_blank else 'first'
+    return count_many(index, {key: CounterSpec(key, mode)})[key]
 
 
 def count_contents_paraphase(index, key):
     # Counts the number of times that values occur in a particular column:
-    value_counter = Counter()
-    for paper, rows in index.items():
-        value = rows[0][key]
-        value = value.strip()
-        if 'Multiple' in value or 'multiple' in value:
-            value = " ".join(value.split(":")[1:])
-            value = value.replace("-", "").strip()
-            value = re.sub(r'(\d*\/*\d*\w\.) ', ' ', value)
-            items = value.strip().split(', ')
-            value_counter.update([item.strip() for item in items])
-        elif value != "":
-            value = value.replace("-", "").strip()
-            value = re.sub(r'(\d*\/*\d*\w\.) ', ' ', value)
-            value = value.strip()
-            value_counter[value] += 1
-    return value_counter
+    return count_many(index, {key: CounterSpec(key, 'first', 'paraphrase')})[key]
 
 
 def count_statistic(index, key):
     # Counts the number of times that values occur in a particular column""
-    value_counter = Counter()
-    for paper, rows in index.items():
-        value = rows[0][key]
-        value = value.lower()
-        if value != "" and value != "none given":
-            split_crit = ""
-            if "," in value:
-                split_crit = ","
-            else:
-                split_crit = ";"
-            items = value.split(split_crit)
-            for item in items:
-                value_counter[item.strip()] += 1
-    return value_counter
-
-
-stats_normalisation_dict = {"SD": "standard deviation",
-                            "standard dev": "standard deviation",
-                            "Mean": "mean",
-                            "means": "mean",
-                            "raw counts": "raw numbers"}
-
-
-def normalise_statistics_terms(term: str):
-    if term in stats_normalisation_dict:
-        return [stats_normalisation_dict[term]]
-    if "ANOVA" in term:
-        return ["ANOVA"]
-    if "Kruskal-Wallis" in term:
-        return ["Kruskall-Wallis"]
-    if re.match("[Aa]nalysis [Oo]f [Vv]ariance", term):
-        return ["ANOVA"]
-    if re.match("Mann-Whitney.*U", term):
-        return ["Mann-Whitney U-test"]
-    if re.match("[Cc]hi[\- ]sq", term):
-        return ["Chi-squared"]
-    if re.match("[Rr]atio", term):
-        return ['ratio']
-    if "percentage" in term:
-        return ["proportion"]
-    if "specif" in term:
-        return ['underspecified']
-    if term.startswith("t-test"):
-        return ['t-test']
-    return [term]
+    return count_many(index, {key: CounterSpec(key, 'first', split_statistic)})[key]
 
 
 def count_statistic_modified(index, key):
     # Counts the number of times that values occur in a particular column:
-    value_counter = Counter()
-    for paper, rows in index.items():
-        value = rows[0][key]
-        if value != "" and value != "none given":
-            split_crit = ""
-            if "," in value:
-                split_crit = ","
-            else:
-                split_crit = ";"
-            value = re.sub("(2|two|Two)-tail(ed)*", "two-tailed", value)
-            items = value.split(split_crit)
-            for item in items:
-                normalised = normalise_statistics_terms(item.strip())
-                for x in normalised:
-                    value_counter[x] += 1
-    return value_counter
+    return count_many(index, {key: CounterSpec(key, 'first', split_statistic_modified)})[key]
 
 
 def convert_percent(counter_values):
@@ -225,93 +194,57 @@ def count_empty(index, key):
     return count
 
 
-def year_wise_counts(index, key, filename):
+# By default, publication years are split into before and after 2010.
+SPLIT_2010 = [float('-inf'), 2010, float('inf')]
+SPLIT_2010_LABELS = ['Before 2010', 'After 2010']
+# Values meaning that no criterion or definition was given.
+NOT_GIVEN = {"", "none given", "not given"}
+
+
+def year_wise_counts(index, key, filename, bins=SPLIT_2010, labels=SPLIT_2010_LABELS, frame=None):
     """
-    Calculates year wise counts (before and after 2010) and writes it a latex file
+    Calculates year wise counts (before and after 2010 by default) and writes it a latex file
     Inputs - 
         Index - excel file
         Key - column which needs to be calculated
         filename - filename of the tex file
+        bins, labels - how years are bucketed (see longform.bucket_years)
+        frame - the index as a DataFrame (see longform.index_to_frame), if it has already been built
     Outputs:
-        A latex file of the counts containing the criterion, before 2010, after 2010, total values 
+        A latex file of the counts containing the criterion, a column per bucket, total values 
     """
-    b4_value_counter = Counter()
-    after_value_counter = Counter()
-    for paper, rows in index.items():
-        value = rows[0][key]
-        value = value.lower()
-        year = rows[0]["pub_year"]
-        if 'Multiple' in value or 'multiple' in value and key != "system_output":
-            value = " ".join(value.split(":")[1:])
-            items = value.strip().split(', ')
-            if year < 2010:
-                b4_value_counter.update([item.strip() for item in items])
-            else:
-                after_value_counter.update([item.strip() for item in items])
-        elif value != "":
-            if year < 2010:
-                b4_value_counter[value] += 1
-            else:
-                after_value_counter[value] += 1
-    rows = []
-    languages = list(set(list(b4_value_counter.keys()) + list(after_value_counter.keys())))
-    for lang in languages:
-        if lang in b4_value_counter.keys():
-            b4_value = b4_value_counter[lang]
-        else:
-            b4_value = 0
-        if lang in after_value_counter.keys():
-            after_value = after_value_counter[lang]
-        else:
-            after_value = 0
-        rows.append([lang, b4_value, after_value, b4_value + after_value])
-    rows.sort(key=lambda k: k[3], reverse=True)
-    headers = ['Criterion', 'Before 2010', 'After 2010', "Total"]
-    write_table(rows, headers, filename)
+    frame = long_form(index).frame(first_only=True) if frame is None else frame[frame['row'] == 0]
+    # As before, 'none given' etc. are counted as values, and system_output lists are not split.
+    long = explode_contents(frame, key, keep_blank_values=True, split_system_output=False)
+    write_year_table(year_crosstab(long, frame, bins, labels), filename)
 
 
-def year_wise_verbatim_def_counts(index, filename):
+def year_wise_verbatim_def_counts(index, filename, bins=SPLIT_2010, labels=SPLIT_2010_LABELS, frame=None):
     """
-    Calculates year wise counts (before and after 2010) of the verbatim criterion and writes it a latex file
+    Calculates year wise counts (before and after 2010 by default) of the verbatim criterion and writes it a latex file
+    Only criteria for which a verbatim definition is given are counted.
     Inputs - 
         Index - excel file
         filename - filename of the tex file
+        bins, labels - how years are bucketed (see longform.bucket_years)
+        frame - the index as a DataFrame (see longform.index_to_frame), if it has already been built
     Outputs:
-        A latex file of the counts containing the criterion, before 2010, after 2010, total values 
+        A latex file of the counts containing the criterion, a column per bucket, total values 
     """
-    b4_value_counter = Counter()
-    after_value_counter = Counter()
-    for paper, rows in index.items():
-        for row in rows:
-            verbatim = row["criterion_verbatim"].lower().strip()
-            definition = row["criterion_definition_verbatim"].lower().strip()
-            year = row["pub_year"]
-            if verbatim != "" and verbatim != "none given" and verbatim != "not given":
-                if definition != "" and definition != "none given" and definition != "not given":
-                    if year < 2010:
-                        if verbatim in b4_value_counter.keys():
-                            b4_value_counter[verbatim] = b4_value_counter[verbatim] + 1
-                        else:
-                            b4_value_counter[verbatim] = 1
-                    else:
-                        if verbatim in after_value_counter.keys():
-                            after_value_counter[verbatim] = after_value_counter[verbatim] + 1
-                        else:
-                            after_value_counter[verbatim] = 1
-    rows = []
-    all_criterion = list(set(list(after_value_counter.keys()) + list(b4_value_counter.keys())))
-    for crit in all_criterion:
-        if crit in b4_value_counter.keys():
-            b4_value = b4_value_counter[crit]
-        else:
-            b4_value = 0
-        if crit in after_value_counter.keys():
-            after_value = after_value_counter[crit]
-        else:
-            after_value = 0
-        rows.append([crit, b4_value, after_value, b4_value + after_value])
-    rows.sort(key=lambda k: k[3], reverse=True)
-    headers = ['Criterion', 'Before 2010', 'After 2010', "Total"]
+    frame = long_form(index).frame() if frame is None else frame
+    verbatim = frame['criterion_verbatim'].str.lower().str.strip()
+    definition = frame['criterion_definition_verbatim'].str.lower().str.strip()
+    given = ~verbatim.isin(NOT_GIVEN) & ~definition.isin(NOT_GIVEN)
+    long = pd.DataFrame({'paper': frame['paper'], 'row': frame['row'], 'value': verbatim})[given]
+    write_year_table(year_crosstab(long, frame, bins, labels), filename)
+
+
+def write_year_table(counts, filename):
+    "Write a table of counts per year bucket (as produced by year_crosstab), with totals, sorted by total."
+    rows = [[value] + bucket_counts + [sum(bucket_counts)]
+            for value, bucket_counts in zip(counts.index, counts.values.tolist())]
+    rows.sort(key=lambda k: k[-1], reverse=True)
+    headers = ['Criterion'] + [str(bucket) for bucket in counts.columns] + ["Total"]
     write_table(rows, headers, filename)
 
 
@@ -359,261 +292,211 @@ def count_verbatim_criterion(index, filename):
     write_table(rows, headers, filename)
 
 
-def count_verbatim_definiton(index):
+def count_verbatim_definiton(index, bins=SPLIT_2010, labels=SPLIT_2010_LABELS, frame=None):
     """
     Calculates counts of the criterion definition and if an associated defition was provided or not and is grouped by before 2010 or after 2010.
     Inputs - 
         Index - excel file
-        filename - filename of the tex file
+        bins, labels - how years are bucketed (see longform.bucket_years)
+        frame - the index as a DataFrame (see longform.index_to_frame), if it has already been built
     Outputs:
-        A latex file of the counts containing the criterion, Definitions given, Definitions not given and is grouped by year (before 2010) and (after 2010).
+        Prints the counts of definitions given and not given, grouped by year bucket (before 2010 and after 2010 by default).
     """
-    given_b4_2010 = 0
-    given_after_2010 = 0
-    not_given_b4_2010 = 0
-    not_given_after_2010 = 0
-    for paper, rows in index.items():
-        for row in rows:
-            year = row["pub_year"]
-            definition = row["criterion_definition_verbatim"]
-            if definition != "" and definition != "not given" and definition != "blank" and definition != "unclear" and definition != "none given":
-                if year < 2010:
-                    given_b4_2010 += 1
-                else:
-                    given_after_2010 += 1
-            else:
-                if year < 2010:
-                    not_given_b4_2010 += 1
-                else:
-                    not_given_after_2010 += 1
+    frame = long_form(index).frame() if frame is None else frame
+    given = ~frame['criterion_definition_verbatim'].isin(NOT_GIVEN | {"blank", "unclear"})
+    long = pd.DataFrame({'paper': frame['paper'], 'row': frame['row'],
+                         'value': given.map({True: 'given', False: 'not given'})})
+    counts = year_crosstab(long, frame, bins, labels).reindex(['given', 'not given'], fill_value=0)
+    for status in counts.index:
+        for bucket, count in counts.loc[status].items():
+            print(f"Num of times Verbatim Definition for a criteria is {status} ({bucket}): {count}")
+        print(f"Num of times Verbatim Definition for a criteria is {status} (Total): {counts.loc[status].sum()}")
+        if status == 'given':
+            print("------------------------------ \n")
+
+
+################################################################################
+# Aggregation
 
-    print("Num of times Verbatim Definition for a criteria is given (pre 2010): {}".format(given_b4_2010))
-    print("Num of times Verbatim Definition for a criteria is given (post 2010): {}".format(given_after_2010))
-    print(
-        "Num of times Verbatim Definition for a criteria is given (Total): {}".format(given_after_2010 + given_b4_2010))
-    print("------------------------------ \n")
-    print("Num of times Verbatim Definition for a criteria is not given (pre 2010): {}".format(not_given_b4_2010))
-    print("Num of times Verbatim Definition for a criteria is not given (post 2010): {}".format(not_given_after_2010))
-    print("Num of times Verbatim Definition for a criteria is not given (Total): {}".format(
-        not_given_b4_2010 + not_given_after_2010))
+# A declarative description of a counter:
+# * column: the column that is counted
+# * mode: which rows are counted, and how
+#   - 'first': the values in the first row of each paper
+#   - 'first_inc_blank': like 'first', but counting blanks as 'None Given/Blank'
+#   - 'unique': each distinct value once per row, for every row
+#   - 'all': every value in every row, counting blanks as 'None Given/Blank'
+# * parser: how a cell is turned into a list of values, as in longform.explode():
+#   'contents' (the default) handles 'Multiple (list all):' cells, 'paraphrase' also removes
+#   numbering, and a function such as split_statistic() is applied to each cell.
+CounterSpec = namedtuple('CounterSpec', ['column', 'mode', 'parser'], defaults=['contents'])
+
+COUNTER_MODES = {'first', 'first_inc_blank', 'unique', 'all'}
+
+# Modes of a CounterSpec, as modes of longform.count_values()
+LONGFORM_MODES = {'first': 'first', 'first_inc_blank': 'first', 'unique': 'unique', 'all': 'all'}
+
+
+def count_many(index, specs):
+    """
+    Compute several counters from the long-form tables of the index (see longform.long_form).
+    The tables are built once per column and parser, and reused by later calls.
+    Inputs -
+        index - paper index, as produced by get_index()
+        specs - dictionary mapping names to CounterSpecs
+    Outputs:
+        A dictionary mapping the same names to Counters.
+    """
+    for name, spec in specs.items():
+        if spec.mode not in COUNTER_MODES:
+            raise ValueError(f"Unknown counting mode for {name}: {spec.mode}")
+    tables = long_form(index)
+    return {name: tables.count(spec.column, LONGFORM_MODES[spec.mode], spec.parser,
+                               count_blank=spec.mode in {'first_inc_blank', 'all'})
+            for name, spec in specs.items()}
 
 
 ################################################################################
 
 # task to criterion
 
-def task_2_criterion(index, task_counter, filename):
+def task_criterion_pairs(index, frame=None):
+    """
+    Co-occurrence of tasks and verbatim criteria.
+    Rows listing multiple tasks are counted under the full list of tasks.
+    """
+    frame = long_form(index).frame() if frame is None else frame
+    task = frame['system_task'].str.replace("multiple (list all): ", "", regex=False).str.strip()
+    given = ~frame['criterion_verbatim'].isin(NOT_GIVEN)
+    return Cooccurrence.from_pairs(task[given], frame['criterion_verbatim'][given].str.lower().str.strip())
+
+
+def task_criterion_standardized_pairs(index, frame=None):
+    "Co-occurrence of tasks and standardised criteria (each criterion of a row is counted)."
+    frame = long_form(index).frame() if frame is None else frame
+    task = frame['system_task'].str.replace("multiple (list all): ", "", regex=False).str.strip()
+    criteria = frame['criterion_paraphrase'].map(STANDARDISED_CRITERION_NORMALISER).str.split(",")
+    long = pd.DataFrame({'task': task, 'criterion': criteria}).explode('criterion')
+    long = long[~long['criterion'].isin(NOT_GIVEN)]
+    return Cooccurrence.from_pairs(long['task'], long['criterion'].str.lower().str.strip())
+
+
+def verbatim_paraphrase_pairs(index, frame=None):
+    "Co-occurrence of verbatim criteria and their (standardised) paraphrases."
+    frame = long_form(index).frame() if frame is None else frame
+    verbatim = frame['criterion_verbatim'].str.lower()
+    given = ~verbatim.isin(NOT_GIVEN | {"blank", "unclear"})
+    paraphrases = frame['criterion_paraphrase'][given].map(VERBATIM_TO_PARAPHRASE_NORMALISER).str.split(",")
+    long = pd.DataFrame({'verbatim': verbatim[given].str.strip(), 'paraphrase': paraphrases}).explode('paraphrase')
+    long = long[~long['paraphrase'].isin(NOT_GIVEN)]
+    return Cooccurrence.from_pairs(long['verbatim'], long['paraphrase'].str.lower().str.strip() + " ")
+
+
+def task_2_criterion(index, task_counter, filename, frame=None):
     """
     Calculates counts of task and its associated criterion
     Inputs - 
         Index - excel file
         task_counter - A counter of task counts
         filename - filename of the tex file
+        frame - the index as a DataFrame (see longform.index_to_frame), if it has already been built
     Outputs:
         A latex file of the counts containing task, verbatim criterion and count.
     """
-    task2criterion = dict()
-    for paper, rows in index.items():
-        for row in rows:
-            task = row["system_task"]
-            verbatim = row["criterion_verbatim"]
-            task = task.replace("multiple (list all): ", "").strip()
-            if verbatim != "" and verbatim != "none given" and verbatim != "not given":
-                verbatim = verbatim.lower().strip()
-                if task in task2criterion:
-                    criterion_values = task2criterion[task]
-                    if verbatim in criterion_values:
-                        criterion_values[verbatim] = criterion_values[verbatim] + 1
-                    else:
-                        criterion_values[verbatim] = 1
-                    task2criterion[task] = criterion_values
-                else:
-                    criterion_values = {}
-                    criterion_values[verbatim] = 1
-                    task2criterion[task] = criterion_values
-    rows = []
-    for key, value in task_counter.most_common():
-        if key in task2criterion.keys():
-            v = task2criterion[key]
-            sorted_values = dict(sorted(v.items(), key=operator.itemgetter(1), reverse=True))
-            for crit, count in sorted_values.items():
-                rows.append([key, crit, count])
-        headers = ['Task', 'Verbatim Criterion', 'Count']
-
+    task2criterion = task_criterion_pairs(index, frame)
+    rows = task2criterion.to_rows(row_order=[task for task, _ in task_counter.most_common()])
+    headers = ['Task', 'Verbatim Criterion', 'Count']
     write_table(rows, headers, filename)
-    df = pd.DataFrame(rows, columns=['Task', 'Verbatim Criterion', 'Count'])
-    df.to_excel("./Data/task2criterion.xlsx", index=False)
+    df = pd.DataFrame(rows, columns=headers)
+    write_excel(df, "task2criterion.xlsx")
 
 
-def task_2_criterion_standardized(index, task_counter, filename):
+def task_2_criterion_standardized(index, task_counter, filename, frame=None):
     """
     Calculates counts of task and its associated criterion (standardized)
     Inputs - 
         Index - excel file
         task_counter - A counter of task counts
         filename - filename of the tex file
+        frame - the index as a DataFrame (see longform.index_to_frame), if it has already been built
     Outputs:
         A latex file of the counts containing task, verbatim criterion (Standardized) and count.
     """
-
-    task2criterion = dict()
-    for paper, rows in index.items():
-        for row in rows:
-            task = row["system_task"]
-            verbatim = row["criterion_paraphrase"]
-            task = task.replace("multiple (list all): ", "").strip()
-            verbatim = verbatim.replace("-", "").strip()
-            verbatim = re.sub(r'(\d*\/*\d*\w\.) ', ' ', verbatim)
-            verbatim = verbatim.replace(".", "").strip()
-            verbatim = verbatim.replace("Multiple (list all):", "").strip()
-            if "," in verbatim:
-                split_verbatim = verbatim.split(",")
-            else:
-                split_verbatim = [verbatim]
-            for verb in split_verbatim:
-                if verb != "" and verb != "none given" and verb != "not given":
-                    verb = verb.lower().strip()
-                    if task in task2criterion:
-                        criterion_values = task2criterion[task]
-                        if verb in criterion_values:
-                            criterion_values[verb] = criterion_values[verb] + 1
-                        else:
-                            criterion_values[verb] = 1
-                        task2criterion[task] = criterion_values
-                    else:
-                        criterion_values = {}
-                        criterion_values[verb] = 1
-                        task2criterion[task] = criterion_values
-    rows = []
-    for key, value in task_counter.most_common():
-        if key in task2criterion.keys():
-            v = task2criterion[key]
-            sorted_values = dict(sorted(v.items(), key=operator.itemgetter(1), reverse=True))
-            for crit, count in sorted_values.items():
-                rows.append([key, crit, count])
-        headers = ['Task', 'Verbatim Criterion', 'Count']
-
+    task2criterion = task_criterion_standardized_pairs(index, frame)
+    rows = task2criterion.to_rows(row_order=[task for task, _ in task_counter.most_common()])
+    headers = ['Task', 'Verbatim Criterion', 'Count']
     write_table(rows, headers, filename)
-    df = pd.DataFrame(rows, columns=['Task', 'Verbatim Criterion', 'Count'])
-    df.to_excel("./Data/task2criterion_standardized.xlsx", index=False)
+    df = pd.DataFrame(rows, columns=headers)
+    write_excel(df, "task2criterion_standardized.xlsx")
 
 
-def criterion_2_paraphrased(index, filename):
+def criterion_2_paraphrased(index, filename, frame=None):
     """
     Calculates counts of criterion and its paraphrased criterion
     Inputs - 
         Index - excel file
         filename - filename of the tex file
+        frame - the index as a DataFrame (see longform.index_to_frame), if it has already been built
     Outputs:
         A latex file of the counts containing task, verbatim criterion (Standardized) and count.
         A excel mapping varbatim to the standarized counts [Needed for the Sankey Diagram]
     """
-    verbatim2paraphrase = dict()
-    for paper, rows in index.items():
-        for row in rows:
-            verbatim = row["criterion_verbatim"].lower()
-            if verbatim != "" and verbatim != "not given" and verbatim != "blank" and verbatim != "unclear" and verbatim != "none given":
-                verbatim = verbatim.strip()
-                paraphrase = row["criterion_paraphrase"]
-                paraphrase = paraphrase.lower()
-                paraphrase = paraphrase.replace("multiple (list all)", "").strip()
-                paraphrase = paraphrase.replace("-", "").strip()
-                paraphrase = re.sub(r'(\d*\/*\d*\w\.)', ' ', paraphrase)
-                paraphrase = paraphrase.replace(".", "").strip()
-                paraphrase = paraphrase.replace(":", "").strip()
-                if "," in paraphrase:
-                    split_para = paraphrase.split(",")
-                else:
-                    split_para = [paraphrase]
-                for verb in split_para:
-                    if verb != "" and verb != "none given" and verb != "not given":
-                        verb = verb.lower().strip() + " "
-                        if verbatim in verbatim2paraphrase:
-                            criterion_values = verbatim2paraphrase[verbatim]
-                            if verb in criterion_values:
-                                criterion_values[verb] = criterion_values[verb] + 1
-                            else:
-                                criterion_values[verb] = 1
-                            verbatim2paraphrase[verbatim] = criterion_values
-                        else:
-                            criterion_values = {}
-                            criterion_values[verb] = 1
-                            verbatim2paraphrase[verbatim] = criterion_values
-    rows = []
-    for key, value in verbatim2paraphrase.items():
-        # for k,v in task2criterion.items():
-        # if key in task2criterion.keys():
-        # v = task2criterion[key]
-        sorted_values = dict(sorted(value.items(), key=operator.itemgetter(1), reverse=True))
-        for crit, count in sorted_values.items():
-            rows.append([key, crit, count])
-        headers = ['Verbatim', 'Standardised', 'Count']
-
+    verbatim2paraphrase = verbatim_paraphrase_pairs(index, frame)
+    rows = verbatim2paraphrase.to_rows()
+    headers = ['Verbatim', 'Standardised', 'Count']
     write_table(rows, headers, filename)
-    df = pd.DataFrame(rows, columns=['Verbatim', 'Standardised', 'Count'])
-    df.to_excel("./Data/verbatim_to_standardized.xlsx", index=False)
+    df = pd.DataFrame(rows, columns=headers)
+    write_excel(df, "verbatim_to_standardized.xlsx")
 
 
 ################################################################################
 # Create confusion tables
 
-def get_confusion_indices(index):
-    "Build confusion indices."
-    author_criteria_index = defaultdict(set)
-    paraphrase_criteria_index = defaultdict(set)
-    for paper, rows in index.items():
-        for row in rows:
-            verbatim = row["criterion_verbatim"]
-            paraphrase = row["criterion_paraphrase"]
-            # If verbatim is specified
-            if verbatim not in {'not given', 'none given'}:
-                # Add paraphrase to the set of criteria that are denoted by the verbatim criterion.
-                author_criteria_index[verbatim].add(paraphrase)
-                # Add verbatim to the set of criteria that are used to refer to the paraphrased criterion.
-                paraphrase_criteria_index[paraphrase].add(verbatim)
-    return author_criteria_index, paraphrase_criteria_index
+ConfusionIndices = namedtuple('ConfusionIndices', ['author', 'paraphrase', 'author_normalised', 'paraphrase_normalised'])
 
+# Confusion tables written by write_confusion_tables(): (variant of the confusion indices, filename)
+CONFUSION_TABLES = [('author', "confusion_author_criteria.tex"),
+                    ('paraphrase', "confusion_paraphrased_criteria.tex"),
+                    ('author_normalised', "confusion_author_criteria_mod.tex"),
+                    ('paraphrase_normalised', "confusion_paraphrased_criteria_mod.tex")]
 
-def get_confusion_indices_modified(index):
-    "Build confusion indices."
-    author_criteria_index = defaultdict(set)
-    paraphrase_criteria_index = defaultdict(set)
+
+def build_confusion_indices(index):
+    """
+    Build all confusion indices in a single pass over the rows.
+    The raw indices use the criteria as written; in the normalised indices, the paraphrased criteria
+    are cleaned with CONFUSION_PARAPHRASE_NORMALISER and the verbatim criteria are lowercased.
+    """
+    indices = ConfusionIndices(*(defaultdict(set) for _ in ConfusionIndices._fields))
     for paper, rows in index.items():
         for row in rows:
             verbatim = row["criterion_verbatim"]
             paraphrase = row["criterion_paraphrase"]
             # If verbatim is specified
             if verbatim not in {'not given', 'none given'}:
+                normalised = CONFUSION_PARAPHRASE_NORMALISER(paraphrase)
                 # Add paraphrase to the set of criteria that are denoted by the verbatim criterion.
-                paraphrase = paraphrase.replace("-", "").strip()
-                paraphrase = re.sub(r'(\d*\/*\d*\w\.)', ' ', paraphrase)
-                paraphrase = paraphrase.replace(".", "").strip()
-                paraphrase = paraphrase.replace(",", "COMMA")
-                author_criteria_index[verbatim.lower()].add(paraphrase)
+                indices.author[verbatim].add(paraphrase)
+                indices.author_normalised[verbatim.lower()].add(normalised)
                 # Add verbatim to the set of criteria that are used to refer to the paraphrased criterion.
-                paraphrase_criteria_index[paraphrase].add(verbatim)
-    return author_criteria_index, paraphrase_criteria_index
+                indices.paraphrase[paraphrase].add(verbatim)
+                indices.paraphrase_normalised[normalised].add(verbatim)
+    return indices
 
 
-def get_confusion_indices_modified_for_table_9(index):
+def get_confusion_indices(index):
     "Build confusion indices."
-    author_criteria_index = defaultdict(set)
-    paraphrase_criteria_index = defaultdict(set)
-    for paper, rows in index.items():
-        for row in rows:
-            verbatim = row["criterion_verbatim"]
-            paraphrase = row["criterion_paraphrase"]
-            # If verbatim is specified
-            if verbatim not in {'not given', 'none given'}:
-                # Add paraphrase to the set of criteria that are denoted by the verbatim criterion.
-                paraphrase = paraphrase.replace("-", "").strip()
-                paraphrase = re.sub(r'(\d*\/*\d*\w\.)', ' ', paraphrase)
-                paraphrase = paraphrase.replace(".", "").strip()
-                paraphrase = paraphrase.replace(",", "COMMA")
-                author_criteria_index[verbatim.lower()].add(paraphrase)
-                # Add verbatim to the set of criteria that are used to refer to the paraphrased criterion.
-                paraphrase_criteria_index[paraphrase].add(verbatim)
-    return author_criteria_index, paraphrase_criteria_index
+    indices = build_confusion_indices(index)
+    return indices.author, indices.paraphrase
+
+
+def get_confusion_indices_modified(index):
+    "Build confusion indices, with normalised criteria."
+    indices = build_confusion_indices(index)
+    return indices.author_normalised, indices.paraphrase_normalised
+
+
+# Kept for backwards compatibility; this was an identical copy of get_confusion_indices_modified().
+get_confusion_indices_modified_for_table_9 = get_confusion_indices_modified
 
 
 def value_length(pair):
@@ -626,11 +509,10 @@ def get_confusion_table(confusion_index, n=10):
     Construct a table with the top-n terms that have the most confusion.
     (Where confusion means the extent to which multiple terms are associated with the same criterion.)
     """
-    frequency_list = sorted(confusion_index.items(),
-                            key=value_length,
-                            reverse=True)
+    # Same order as sorting the whole index (ties keep their order), but only the top n are kept.
+    frequency_list = heapq.nlargest(n, confusion_index.items(), key=value_length)
     rows = [[criterion, ', '.join(corresponding_set), len(corresponding_set)]
-            for criterion, corresponding_set in frequency_list[:n]]
+            for criterion, corresponding_set in frequency_list]
     header = ['Criterion', 'Corresponding criteria', 'Amount']
     return rows, header
 
@@ -640,24 +522,13 @@ def write_confusion_tables(index, n=10):
     Write confusion tables to a file.
     
     This main function uses the following two functions:
-    - get_confusion_indices()
+    - build_confusion_indices()
     - get_confusion_table()
     """
-    author_criteria_index, paraphrase_criteria_index = get_confusion_indices(index)
-    author_criteria_index_mod_for_table_9, paraphrase_criteria_index_mod_for_table_9 = get_confusion_indices_modified_for_table_9(
-        index)
-
-    rows, headers = get_confusion_table(author_criteria_index, n)
-    write_table(rows, headers, "confusion_author_criteria.tex")
-
-    rows, headers = get_confusion_table(paraphrase_criteria_index, n)
-    write_table(rows, headers, "confusion_paraphrased_criteria.tex")
-
-    rows, headers = get_confusion_table(author_criteria_index_mod_for_table_9, n)
-    write_table(rows, headers, "confusion_author_criteria_mod.tex")
-
-    rows, headers = get_confusion_table(paraphrase_criteria_index_mod_for_table_9, n)
-    write_table(rows, headers, "confusion_paraphrased_criteria_mod.tex")
+    indices = build_confusion_indices(index)
+    for variant, filename in CONFUSION_TABLES:
+        rows, headers = get_confusion_table(getattr(indices, variant), n)
+        write_table(rows, headers, filename)
 
 
 ################################################################################
@@ -722,63 +593,98 @@ def plot_acd(index, filename='are_definitions_criteria_given.pdf'):
     for patch in leg.get_patches():
         patch.set_height(14)
         patch.set_y(-4.5)
-    plt.savefig(f"./Figures/{filename}")
+    ARTIFACTS.figure(ax.figure, filename)
+    # The sink renders the figure itself (at the end of a batch), so it no longer needs to be current
+    plt.close(ax.figure)
 
 
 ################################################################################
 # Main code
 
-def main():
+def write_all():
     # Build index
     index = get_index("./terminology_complete.xlsx")
-
-    # Compute frequency tables (First Row only):
-    task_counter = count_contents(index, 'system_task')
-    output_counter = count_contents(index, 'system_output')
-    language_counter = count_contents(index, 'system_language')
-    criterion_verbatim_counter = count_contents(index, 'criterion_verbatim')
-    criterion_paraphrase_counter = count_contents_paraphase(index, 'criterion_paraphrase')
-    stat_counter = count_statistic(index, 'op_statistics')
-    stat_counter_mod = count_statistic_modified(index, 'op_statistics')
-    response_elicitation_counter = count_contents(index, 'op_form')
+    # The index as a DataFrame, shared by all the vectorised counts below
+    frame = long_form(index).frame()
+
+    # Compute all frequency tables from the shared long-form tables of the index.
+    counters = count_many(index, {
+        # Frequency tables (First Row only):
+        'task': CounterSpec('system_task', 'first'),
+        'output': CounterSpec('system_output', 'first'),
+        'language': CounterSpec('system_language', 'first'),
+        'criterion_verbatim': CounterSpec('criterion_verbatim', 'first'),
+        'criterion_paraphrase': CounterSpec('criterion_paraphrase', 'first', 'paraphrase'),
+        'stat': CounterSpec('op_statistics', 'first', split_statistic),
+        'stat_mod': CounterSpec('op_statistics', 'first', split_statistic_modified),
+        'response_elicitation': CounterSpec('op_form', 'first'),
+        # Unique Complete Counts:
+        'task_unique': CounterSpec('system_task', 'unique'),
+        'output_unique': CounterSpec('system_output', 'unique'),
+        'input_unique': CounterSpec('system_input', 'unique'),
+        'language_unique': CounterSpec('system_language', 'unique'),
+        # Complete Counts including blanks:
+        'op_response_values_inc_blank': CounterSpec('op_response_values', 'all'),
+        'op_instrument_size_inc_blank': CounterSpec('op_instrument_size', 'all'),
+        'op_instrument_type_inc_blank': CounterSpec('op_instrument_type', 'all'),
+        'op_data_type_inc_blank': CounterSpec('op_data_type', 'all'),
+        'op_form_inc_blank': CounterSpec('op_form', 'all'),
+        'op_question_prompt_verbatim_inc_blank': CounterSpec('op_question_prompt_verbatim', 'all'),
+        'op_question_prompt_paraphrase_inc_blank': CounterSpec('op_question_prompt_paraphrase', 'all'),
+        'op_statistics_inc_blank': CounterSpec('op_statistics', 'all'),
+        'criterion_verbatim_inc_blank': CounterSpec('criterion_verbatim', 'all'),
+        'criterion_definition_verbatim_inc_blank': CounterSpec('criterion_definition_verbatim', 'all'),
+        'criterion_paraphrase_inc_blank': CounterSpec('criterion_paraphrase', 'all'),
+        'criterion_definition_paraphrase_inc_blank': CounterSpec('criterion_definition_paraphrase', 'all'),
+    })
+
+    # Frequency tables (First Row only):
+    task_counter = counters['task']
+    output_counter = counters['output']
+    language_counter = counters['language']
+    criterion_verbatim_counter = counters['criterion_verbatim']
+    criterion_paraphrase_counter = counters['criterion_paraphrase']
+    stat_counter = counters['stat']
+    stat_counter_mod = counters['stat_mod']
+    response_elicitation_counter = counters['response_elicitation']
 
     # Unique Complete Counts:
-    task_unique_counter = unique_count_contents(index, 'system_task')
-    output_unique_counter = unique_count_contents(index, 'system_output')
-    input_unique_counter = unique_count_contents(index, 'system_input')
-    language_unique_counter = unique_count_contents(index, 'system_language')
+    task_unique_counter = counters['task_unique']
+    output_unique_counter = counters['output_unique']
+    input_unique_counter = counters['input_unique']
+    language_unique_counter = counters['language_unique']
 
     # Complete Counts including blanks:
-    op_response_values_inc_blank = count_all_contents(index, "op_response_values")
-    op_instrument_size_inc_blank = count_all_contents(index, "op_instrument_size")
-    op_instrument_type_inc_blank = count_all_contents(index, "op_instrument_type")
-    op_data_type_inc_blank = count_all_contents(index, "op_data_type")
-    op_form_inc_blank = count_all_contents(index, "op_form")
-    op_question_prompt_verbatim_inc_blank = count_all_contents(index, "op_question_prompt_verbatim")
-    op_question_prompt_paraphrase_inc_blank = count_all_contents(index, "op_question_prompt_paraphrase")
-    op_statistics_inc_blank = count_all_contents(index, "op_statistics")
-
-    criterion_verbatim_inc_blank = count_all_contents(index, "criterion_verbatim")
-    criterion_definition_verbatim_inc_blank = count_all_contents(index, "criterion_definition_verbatim")
-    criterion_paraphrase_inc_blank = count_all_contents(index, "criterion_paraphrase")
-    criterion_definition_paraphrase_inc_blank = count_all_contents(index, "criterion_definition_paraphrase")
+    op_response_values_inc_blank = counters['op_response_values_inc_blank']
+    op_instrument_size_inc_blank = counters['op_instrument_size_inc_blank']
+    op_instrument_type_inc_blank = counters['op_instrument_type_inc_blank']
+    op_data_type_inc_blank = counters['op_data_type_inc_blank']
+    op_form_inc_blank = counters['op_form_inc_blank']
+    op_question_prompt_verbatim_inc_blank = counters['op_question_prompt_verbatim_inc_blank']
+    op_question_prompt_paraphrase_inc_blank = counters['op_question_prompt_paraphrase_inc_blank']
+    op_statistics_inc_blank = counters['op_statistics_inc_blank']
+
+    criterion_verbatim_inc_blank = counters['criterion_verbatim_inc_blank']
+    criterion_definition_verbatim_inc_blank = counters['criterion_definition_verbatim_inc_blank']
+    criterion_paraphrase_inc_blank = counters['criterion_paraphrase_inc_blank']
+    criterion_definition_paraphrase_inc_blank = counters['criterion_definition_paraphrase_inc_blank']
 
     ##COunt empty
     print("Number of empty Response elictiation: {}".format(count_empty(index, "op_form")))
     ## Year wise counts
 
-    year_wise_counts(index, 'system_language', "language_by_year.tex")
-    year_wise_counts(index, 'system_task', "task_by_year.tex")
-    task_2_criterion(index, task_counter, "task2criterion.tex")
-    task_2_criterion_standardized(index, task_counter, "task2criterion_standardized.tex")
-    criterion_2_paraphrased(index, "verbatim2standardised.tex")
-    year_wise_verbatim_def_counts(index, "defintion_give_by_year.tex")
+    year_wise_counts(index, 'system_language', "language_by_year.tex", frame=frame)
+    year_wise_counts(index, 'system_task', "task_by_year.tex", frame=frame)
+    task_2_criterion(index, task_counter, "task2criterion.tex", frame)
+    task_2_criterion_standardized(index, task_counter, "task2criterion_standardized.tex", frame)
+    criterion_2_paraphrased(index, "verbatim2standardised.tex", frame)
+    year_wise_verbatim_def_counts(index, "defintion_give_by_year.tex", frame=frame)
 
     # Verbatim crierion given or not
     count_verbatim_criterion(index, "verbatim_given_or_not.tex")
 
     # Verbatim crierion given or not irrespective if the criteria was mention or not
-    count_verbatim_definiton(index)
+    count_verbatim_definiton(index, frame=frame)
     # Convert frequencies to percent
     percent_task_counter = convert_percent(task_counter)
     percent_output_counter = convert_percent(output_counter)
@@ -856,6 +762,17 @@ def main():
     write_confusion_tables(index, 10)
 
 
+def main(bundle=None):
+    """
+    Compute all statistics, and write the tables and data files.
+    The files are written together at the end, in parallel; pass `bundle` (e.g. 'results.xlsx' or
+    'results.parquet') to write everything to that single file instead.
+    """
+    ARTIFACTS.bundle = bundle
+    with ARTIFACTS.batch():
+        write_all()
+
+
 if __name__ == "__main__":
     os.makedirs("Data", exist_ok=True)
     os.makedirs("Figures", exist_ok=True)
@@ -0,0 +1,302 @@
+"""
+Vectorised parsing of multi-valued cells.
+
+Many columns contain cells like 'Multiple (list all): data-to-text, summarisation'.
+The functions in this module turn such a column into a long-form table, with one
+(paper, row, value) entry per value, using pandas string methods instead of Python loops.
+
+A LongForm keeps these tables for one paper index, so that counting several columns (or the
+same column again) does not rebuild them; long_form(index) returns the one for an index.
+"""
+
+from collections import Counter
+import weakref
+
+import pandas as pd
+
+BLANK_VALUES = ["", "none given", "not given", "blank"]
+BLANK_LABEL = "None Given/Blank"
+NUMBERING_RE = r'(\d*\/*\d*\w\.) '
+
+
+def index_to_frame(index, first_only=False):
+    """
+    Convert the paper index to a DataFrame.
+    Adds a `paper` column with the index key and a `row` column with the position of the row within the paper.
+    With `first_only`, only the first row of each paper is included.
+    """
+    if first_only:
+        papers = [paper for paper, paper_rows in index.items() if paper_rows]
+        rows = [index[paper][0] for paper in papers]
+        positions = [0] * len(rows)
+    else:
+        papers = [paper for paper, paper_rows in index.items() for _ in paper_rows]
+        rows = [row for paper_rows in index.values() for row in paper_rows]
+        positions = [i for paper_rows in index.values() for i in range(len(paper_rows))]
+    if rows and hasattr(rows[0], '_fields') and set(map(type, rows)) == {type(rows[0])}:
+        # Row records (see sheetreader.Row) are turned into columns directly; keeping the cells
+        # as Python objects skips the inference of column types, which is most of the cost.
+        frame = pd.DataFrame(rows, columns=rows[0]._fields, dtype=object)
+    else:
+        frame = pd.DataFrame.from_records([dict(row) for row in rows])
+    frame['paper'] = papers
+    frame['row'] = positions
+    return frame
+
+
+def _explode(frame, values):
+    """
+    Turn a Series of values into a (paper, row, value) table.
+    `values` is indexed by the position in `frame` of the row each value comes from, in order;
+    missing values are left out.
+    """
+    values = values[values.notna()]
+    positions = values.index.to_numpy(dtype=int)
+    return pd.DataFrame({'paper': frame['paper'].to_numpy()[positions],
+                         'row': frame['row'].to_numpy()[positions],
+                         'value': values.str.strip().to_numpy()})
+
+
+def _in_order(*parts):
+    "Concatenate Series indexed by row position, keeping the values of each row together and in order."
+    return pd.concat(parts).sort_index(kind='stable')
+
+
+def _after_first_colon(values):
+    "Equivalent of `' '.join(value.split(':')[1:])`."
+    return values.str.split(':', n=1).str[1].fillna('').str.replace(':', ' ', regex=False)
+
+
+def explode_contents(frame, column, count_blank=False, keep_blank_values=False, split_system_output=True):
+    """
+    Long-form table of the values in `column`, lowercased.
+    Cells starting with 'Multiple (list all):' contain a comma-separated list of values;
+    blank cells ('', 'none given', 'not given' or 'blank') produce no values.
+    Inputs -
+        frame - DataFrame produced by index_to_frame()
+        column - column to parse
+        count_blank - whether blank cells should produce a 'None Given/Blank' value
+        keep_blank_values - whether 'none given', 'not given' and 'blank' are kept as values
+                            (empty cells still produce no value)
+        split_system_output - whether 'Multiple (list all):' cells of system_output are split;
+                              if not, the whole cell is one value (as in year_wise_counts())
+    Outputs:
+        A DataFrame with the columns paper, row and value.
+    """
+    values = frame[column].astype(str).str.lower().reset_index(drop=True)
+    multiple = values.str.contains('multiple', regex=False)
+    if column == "system_output" and not split_system_output:
+        multiple = pd.Series(False, index=values.index)
+    blank = (values == "") if keep_blank_values else values.isin(BLANK_VALUES)
+
+    if column != "system_output":
+        listed = _after_first_colon(values[multiple])
+    else:
+        listed = values[multiple].str.replace("multiple (list all):", "", regex=False)
+    parts = [listed.str.strip().str.split(', ').explode(), values[~multiple & ~blank]]
+    if count_blank:
+        parts.append(pd.Series(BLANK_LABEL, index=values.index[~multiple & blank], dtype=object))
+    return _explode(frame, _in_order(*parts))
+
+
+def explode_paraphrase(frame, column):
+    """
+    Long-form table of the values in `column`, with dashes and numbering removed.
+    Cells containing 'Multiple' list values after the first colon, separated by commas.
+    """
+    cells = frame[column].astype(str).str.strip().reset_index(drop=True)
+    multiple = cells.str.contains('Multiple', regex=False) | cells.str.contains('multiple', regex=False)
+    values = cells.where(~multiple, _after_first_colon(cells))
+    values = values.str.replace("-", "", regex=False).str.strip()
+    values = values.str.replace(NUMBERING_RE, ' ', regex=True)
+
+    single = ~multiple & (cells != "")
+    return _explode(frame, _in_order(values[multiple].str.strip().str.split(', ').explode(), values[single]))
+
+
+def explode(frame, column, parser='contents', count_blank=False):
+    """
+    Long-form table of the values in `column`.
+    Inputs -
+        frame - DataFrame produced by index_to_frame()
+        column - column to parse
+        parser - how the cells are parsed:
+                 'contents' - multi-valued cells, lowercased (see explode_contents())
+                 'paraphrase' - multi-valued cells with numbering removed (see explode_paraphrase())
+                 'value' - the cell value as it is, leaving out empty cells
+                 or a function that turns a cell into a list of values
+        count_blank - for 'contents', whether blank cells should produce a 'None Given/Blank' value
+    Outputs:
+        A DataFrame with the columns paper, row and value.
+    """
+    if parser == 'contents':
+        return explode_contents(frame, column, count_blank)
+    elif parser == 'paraphrase':
+        return explode_paraphrase(frame, column)
+    elif parser == 'value':
+        long = frame[['paper', 'row', column]].rename(columns={column: 'value'})
+        return long[long['value'] != ''].reset_index(drop=True)
+    elif callable(parser):
+        return _explode(frame, frame[column].reset_index(drop=True).map(parser).explode())
+    raise ValueError(f"Unknown parser: {parser}")
+
+
+def count_values(long, mode='first'):
+    """
+    Count the values in a long-form table.
+    Inputs -
+        long - DataFrame produced by explode_contents() or explode_paraphrase()
+        mode - 'first' to count only the first row of each paper,
+               'unique' to count each distinct value once per row,
+               'all' to count every value
+    Outputs:
+        A Counter, with values in order of first occurrence.
+    """
+    if mode == 'first':
+        long = long[long['row'] == 0]
+    elif mode == 'unique':
+        long = long.drop_duplicates(['paper', 'row', 'value'])
+    elif mode != 'all':
+        raise ValueError(f"Unknown counting mode: {mode}")
+    return Counter(long.groupby('value', sort=False).size().to_dict())
+
+
+class LongForm(object):
+    """
+    The long-form tables of a paper index, built when they are first needed and then reused.
+    Counts of first rows only use a frame of the first rows, so the frame of all rows is not built for them.
+    Use long_form(index) to get the LongForm of an index.
+    """
+
+    def __init__(self, index):
+        try:
+            # The cache of long_form() must not keep the index alive.
+            self._index = weakref.ref(index)
+        except TypeError:
+            self._index = lambda: index
+        self.size = index_size(index)
+        self._frames = {}
+        self._tables = {}
+        self._counts = {}
+
+    def frame(self, first_only=False):
+        "The index as a DataFrame (see index_to_frame())."
+        if first_only not in self._frames:
+            if first_only and False in self._frames:
+                frame = self._frames[False]
+                self._frames[True] = frame[frame['row'] == 0].reset_index(drop=True)
+            else:
+                self._frames[first_only] = index_to_frame(self._index(), first_only)
+        return self._frames[first_only]
+
+    def table(self, column, parser='contents', count_blank=False, first_only=False):
+        "Long-form table of a column (see explode())."
+        key = (column, parser, count_blank, first_only)
+        if key not in self._tables:
+            self._tables[key] = explode(self.frame(first_only), column, parser, count_blank)
+        return self._tables[key]
+
+    def count(self, column, mode='first', parser='contents', count_blank=False):
+        "Count the values of a column (see count_values()). Returns a new Counter."
+        key = (column, mode, parser, count_blank)
+        if key not in self._counts:
+            long = self.table(column, parser, count_blank, first_only=mode == 'first')
+            self._counts[key] = count_values(long, mode)
+        return Counter(self._counts[key])
+
+
+def index_size(index):
+    "Number of papers and rows in the index, to notice when a cached LongForm no longer matches it."
+    return len(index), sum(len(rows) for rows in index.values())
+
+
+# id(index) -> (weak reference to the index, LongForm)
+_LONG_FORMS = {}
+
+
+def long_form(index):
+    """
+    The LongForm of a paper index. It is cached for indexes that can be weakly referenced (such as those
+    returned by sheetreader.get_index()) until the index is deleted, or papers or rows are added or removed;
+    after changing the values of rows in place, call forget_long_form(index).
+    """
+    entry = _LONG_FORMS.get(id(index))
+    if entry is not None and entry[0]() is index and entry[1].size == index_size(index):
+        return entry[1]
+    tables = LongForm(index)
+    try:
+        ref = weakref.ref(index, lambda ref, key=id(index): _LONG_FORMS.pop(key, None))
+    except TypeError:
+        return tables
+    _LONG_FORMS[id(index)] = (ref, tables)
+    return tables
+
+
+def forget_long_form(index):
+    "Drop the cached LongForm of an index."
+    _LONG_FORMS.pop(id(index), None)
+
+
+def bucket_years(years, bins=None, labels=None):
+    """
+    Assign each year to a bucket.
+    Inputs -
+        years - Series of years
+        bins - None for one bucket per year,
+               an int for buckets of that many years, labelled by their first year (e.g. 10 for decades),
+               or a list of edges for buckets [edges[i], edges[i + 1]), e.g. [-inf, 2010, inf]
+        labels - labels for the buckets when bins is a list of edges
+    Outputs:
+        A Series of bucket labels (ints, unless bins is a list of edges), with the index of `years`.
+        Years that are missing or not numbers, or outside the edges, are left out.
+    """
+    years = pd.to_numeric(years, errors='coerce').dropna()
+    if bins is None:
+        return years.astype(int)
+    if isinstance(bins, int):
+        return (years // bins * bins).astype(int)
+    return pd.cut(years, bins=bins, labels=labels, right=False).dropna()
+
+
+def sliding_windows(years, width, step=1):
+    """
+    Assign each year to every window of `width` years that contains it.
+    Windows start every `step` years and are labelled 'first-last'.
+    Outputs:
+        A Series of window labels, with the index of `years` repeated once per window.
+    """
+    years = pd.to_numeric(years, errors='coerce').dropna().astype(int)
+    if years.empty:
+        return pd.Series([], dtype=object)
+    first = years.min() - (width - 1)
+    # Only the distinct years are assigned to windows; every row then looks up its year.
+    windows = {year: [f"{start}-{start + width - 1}" for start in range(first, year + 1, step) if start + width > year]
+               for year in years.unique()}
+    return years.map(windows).explode()
+
+
+def year_crosstab(long, frame, bins=None, labels=None, window=None, year_column='pub_year'):
+    """
+    Count the values in a long-form table per bucket of publication years, in one grouped count.
+    Inputs -
+        long - DataFrame with paper, row and value columns (e.g. produced by explode_contents())
+        frame - DataFrame produced by index_to_frame(), with the year of every row
+        bins, labels - how years are bucketed, see bucket_years()
+        window - (width, step) to count over sliding windows of years instead, see sliding_windows()
+    Outputs:
+        A DataFrame with a row per value (sorted) and a column per bucket (in order).
+    """
+    years = long.join(frame.set_index(['paper', 'row'])[year_column], on=['paper', 'row'])[year_column]
+    values = long['value']
+    if window is not None:
+        buckets = sliding_windows(years, *window)
+        values = values.loc[buckets.index]
+    else:
+        buckets = bucket_years(years, bins, labels)
+        values = values.loc[buckets.index]
+    counts = pd.crosstab(values.to_numpy(), buckets.to_numpy(), dropna=False)
+    if labels is not None and window is None:
+        counts = counts.reindex(columns=labels, fill_value=0)
+    counts.index.name = 'value'
+    counts.columns.name = 'years'
+    return counts
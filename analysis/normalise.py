@@ -0,0 +1,72 @@
+"""
+Reusable term normalisation.
+
+A TermNormaliser applies a fixed pipeline to a term:
+1. optionally lower-case the term,
+2. apply a list of regular expression substitutions (stripping whitespace after each one),
+3. look up the result in a table of synonyms,
+4. otherwise, return the canonical term of the first matching rule.
+
+All patterns are compiled once, and results are memoised, so repeated terms are normalised in O(1).
+"""
+
+from functools import lru_cache
+import json
+import os
+import re
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class TermNormaliser(object):
+    def __init__(self, substitutions=(), synonyms=None, rules=(), lowercase=False, cache_size=65536):
+        """
+        Inputs -
+            substitutions - list of (pattern, replacement) pairs, applied in order
+            synonyms - dictionary mapping terms to their canonical form
+            rules - list of (pattern, canonical term, anywhere) triples. If `anywhere` is true,
+                    the pattern may occur anywhere in the term; otherwise it has to match at the start.
+            lowercase - whether to lower-case terms before anything else
+            cache_size - maximum number of memoised terms (least recently used terms are dropped first)
+        """
+        self.lowercase = lowercase
+        self.substitutions = [(re.compile(pattern), replacement) for pattern, replacement in substitutions]
+        self.synonyms = dict(synonyms or {})
+        self.rules = [(re.compile(pattern).search if anywhere else re.compile(pattern).match, term)
+                      for pattern, term, anywhere in rules]
+        self._normalise = lru_cache(maxsize=cache_size)(self._normalise_uncached)
+
+    @classmethod
+    def from_file(cls, filename, **kwargs):
+        """
+        Load a normaliser from a JSON file with the (optional) keys
+        'substitutions', 'synonyms', 'rules' and 'lowercase'.
+        Relative filenames are resolved against the directory of this module.
+        """
+        with open(os.path.join(DATA_DIR, filename)) as f:
+            spec = json.load(f)
+        rules = [(rule['pattern'], rule['term'], rule.get('anywhere', False)) for rule in spec.get('rules', [])]
+        return cls(substitutions=spec.get('substitutions', []),
+                   synonyms=spec.get('synonyms'),
+                   rules=rules,
+                   lowercase=spec.get('lowercase', False),
+                   **kwargs)
+
+    def _normalise_uncached(self, term):
+        if self.lowercase:
+            term = term.lower()
+        for pattern, replacement in self.substitutions:
+            term = pattern.sub(replacement, term).strip()
+        if term in self.synonyms:
+            return self.synonyms[term]
+        for matches, canonical in self.rules:
+            if matches(term):
+                return canonical
+        return term
+
+    def __call__(self, term):
+        "Return the canonical form of `term`."
+        return self._normalise(term)
+
+    def cache_info(self):
+        return self._normalise.cache_info()
@@ -1,32 +1,221 @@
-import pandas as pd
-from collections import defaultdict, Counter
+from collections import defaultdict, namedtuple
+import hashlib
+import os
+import pickle
+import sys
 
-def get_index(filename):
+from openpyxl import load_workbook
+
+COLUMNS = ["key", "annotator", "date_annotated", "annotation_comments",
+					 "exclude", "time_taken", "pub_venue", "pub_authors", "pub_year",
+					 "pub_url", "system_language", "system_input", "system_output",
+					 "system_task", "op_response_values", "op_instrument_size",
+					 "op_instrument_type", "op_data_type", "op_form",
+					 "op_question_prompt_verbatim", "op_question_prompt_paraphrase",
+					 "op_statistics", "criterion_verbatim", "criterion_definition_verbatim",
+					 "criterion_paraphrase", "criterion_definition_paraphrase"]
+
+# Bump this whenever the way the workbook is cleaned changes, so that stale caches are ignored.
+CACHE_VERSION = 5
+
+# Value in the key column that marks the end of the annotations; anything below it is ignored.
+END_OF_DOC = 'END_OF_DOC'
+# Cell values that are read as empty fields (the defaults of pandas.read_excel).
+NA_VALUES = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+						 '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'}
+# The first row holds section titles and the second row the column headers.
+FIRST_DATA_ROW = 3
+# Columns with a small set of repeated values; these strings are interned, so every row shares one copy.
+INTERNED_COLUMNS = {"annotator", "exclude", "pub_venue", "system_language", "system_input", "system_output",
+										"system_task", "op_response_values", "op_instrument_size", "op_instrument_type",
+										"op_data_type", "op_form", "op_statistics", "criterion_paraphrase"}
+
+
+class Row(namedtuple('Row', COLUMNS)):
 		"""
-		Load the Excel file and generate an index, based on the key of the paper.
-		If there is no key, skip the row.
+		One annotation row, with a field for every column: `row.criterion_verbatim`.
+		Rows can still be used like the dictionaries they replace: `row["criterion_verbatim"]`,
+		`row.get("key")`, `"key" in row`, `row.keys()`, `row.values()`, `row.items()` and `dict(row)`
+		all work on the column names. Iterating over a row yields its values, as for any tuple.
+		"""
+		__slots__ = ()
+
+		def __getitem__(self, key):
+				if isinstance(key, str):
+						if key not in self._fields:
+								raise KeyError(key)
+						return getattr(self, key)
+				return tuple.__getitem__(self, key)
+
+		def __contains__(self, key):
+				return key in self._fields
+
+		def get(self, key, default=None):
+				if key in self._fields:
+						return getattr(self, key)
+				return default
+
+		def keys(self):
+				return self._fields
+
+		def values(self):
+				return tuple(self)
+
+		def items(self):
+				return zip(self._fields, self)
+
+		@classmethod
+		def from_values(cls, values):
+				"Build a row from the cleaned cell values, interning the values of categorical columns."
+				return cls._make(sys.intern(value) if column in INTERNED_COLUMNS and isinstance(value, str) else value
+												 for column, value in zip(COLUMNS, values))
+
+
+def cache_path(filename):
+		"Location of the cached copy of the paper index."
+		return f"{filename}.cache.pkl"
+
+
+def file_hash(filename):
+		"SHA-1 of the file contents, read in chunks."
+		sha = hashlib.sha1()
+		with open(filename, 'rb') as f:
+				for chunk in iter(lambda: f.read(1 << 20), b''):
+						sha.update(chunk)
+		return sha.hexdigest()
+
+
+def clean_value(value):
+		"Empty fields become the empty string, as do the values pandas would read as NaN."
+		if value is None or (isinstance(value, str) and value in NA_VALUES):
+				return ''
+		return value
+
+
+def iter_records(filename):
+		"""
+		Stream the rows of the first sheet of the Excel file as Row records, skipping empty rows.
+		Reading stops at the END_OF_DOC row, so scratch areas below it are never parsed,
+		and only one row is held in memory at a time.
+		"""
+		workbook = load_workbook(filename, read_only=True, data_only=True)
+		try:
+				sheet = workbook.worksheets[0]
+				for row in sheet.iter_rows(min_row=FIRST_DATA_ROW, max_col=len(COLUMNS), values_only=True):
+						if row[0] == END_OF_DOC:
+								break
+						values = [clean_value(value) for value in row]
+						if all(value == '' for value in values):
+								continue
+						values.extend([''] * (len(COLUMNS) - len(values)))
+						record = Row.from_values(values)
+						yield record._replace(criterion_verbatim=str(record.criterion_verbatim))
+		finally:
+				workbook.close()
+
+
+def read_workbook(filename):
 		"""
-		df = pd.read_excel(filename, sheet_name=0,header=1)
-		# Replace all NaN in empty fields with the empty string.
-		df.replace(float('nan'), '', regex=True,inplace=True)
-		df.columns = ["key", "annotator", "date_annotated", "annotation_comments", 
-									"exclude", "time_taken", "pub_venue", "pub_authors", "pub_year", 
-									"pub_url", "system_language", "system_input", "system_output", 
-									"system_task", "op_response_values", "op_instrument_size", 
-									"op_instrument_type", "op_data_type", "op_form", 
-									"op_question_prompt_verbatim", "op_question_prompt_paraphrase", 
-									"op_statistics", "criterion_verbatim", "criterion_definition_verbatim", 
-									"criterion_paraphrase", "criterion_definition_paraphrase"]
-		df["criterion_verbatim"] = df["criterion_verbatim"].astype(str)
-		records = df.to_dict('records')
-		index = defaultdict(list)
+		Parse the first sheet of the Excel file (up to END_OF_DOC) into a DataFrame with our column names.
+		Empty fields are replaced with the empty string.
+		"""
+		# Only needed here: building the index does not use pandas.
+		import pandas as pd
+		return pd.DataFrame.from_records(iter_records(filename), columns=COLUMNS)
+
+
+def get_dataframe(filename):
+		"Load the Excel file as a DataFrame."
+		return read_workbook(filename)
+
+
+class PaperIndex(defaultdict):
+		"""
+		Paper key -> list of rows: a defaultdict(list) that can be weakly referenced,
+		so that tables derived from it can be cached (see longform.long_form()).
+		"""
+
+		def __init__(self, *args, **kwargs):
+				super().__init__(list, *args, **kwargs)
+
+		def __reduce__(self):
+				return (type(self), (), None, None, iter(self.items()))
+
+
+def build_index(records):
+		"""
+		Generate an index from the rows, based on the key of the paper.
+		Rows without a key, excluded rows and rows annotated by DG are skipped; reading stops at END_OF_DOC.
+		"""
+		index = PaperIndex()
 		for record in records:
-				key = record['key']
-				if record["exclude"] == 'TRUE':
+				key = record.key
+				if key == '':
+						continue
+				elif record.exclude == 'TRUE':
 						continue
-				elif record["annotator"] == "DG":
+				elif record.annotator == "DG":
 						continue
-				elif key == 'END_OF_DOC':
+				elif key == END_OF_DOC:
 						break
 				index[key].append(record)
 		return index
+
+
+def load_cached_index(filename):
+		"""
+		Return the paper index from the cache if it is still valid, otherwise None.
+		The cache is valid if the size and modification time of the workbook are unchanged,
+		or, if only the modification time changed (e.g. after a checkout), the contents are the same.
+		"""
+		try:
+				with open(cache_path(filename), 'rb') as f:
+						cached = pickle.load(f)
+		except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+				return None
+		if cached.get('version') != CACHE_VERSION:
+				return None
+		stat = os.stat(filename)
+		if cached['size'] != stat.st_size:
+				return None
+		if cached['mtime'] != stat.st_mtime_ns:
+				if cached['sha1'] != file_hash(filename):
+						return None
+				# Same contents: remember the new modification time so the next run skips hashing.
+				write_cached_index(filename, cached['index'])
+		return cached['index']
+
+
+def write_cached_index(filename, index):
+		"Write the paper index to the cache, atomically."
+		stat = os.stat(filename)
+		cached = dict(version=CACHE_VERSION,
+									size=stat.st_size,
+									mtime=stat.st_mtime_ns,
+									sha1=file_hash(filename),
+									index=index)
+		path = cache_path(filename)
+		tmp_path = f"{path}.{os.getpid()}.tmp"
+		try:
+				with open(tmp_path, 'wb') as f:
+						pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+				os.replace(tmp_path, path)
+		except OSError:
+				# Caching is an optimisation; a read-only directory should not break the analysis.
+				if os.path.exists(tmp_path):
+						os.remove(tmp_path)
+
+
+def get_index(filename, use_cache=True):
+		"""
+		Load the Excel file and generate an index, based on the key of the paper.
+		If there is no key, skip the row.
+		The rows are streamed from the workbook into the index; the index is cached next to the file,
+		so only a workbook that changed since the last run is read again.
+		"""
+		index = load_cached_index(filename) if use_cache else None
+		if index is None:
+				index = build_index(iter_records(filename))
+				if use_cache:
+						write_cached_index(filename, index)
+		return index
@@ -0,0 +1,53 @@
+import os
+
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib import pyplot as plt
+import pandas as pd
+import pytest
+
+import artifacts
+from artifacts import ArtifactSink
+
+
+@pytest.fixture
+def sink(tmp_path):
+    for folder in ["Tables", "Data", "Figures"]:
+        os.makedirs(tmp_path / folder)
+    return ArtifactSink(str(tmp_path), workers=2)
+
+
+def test_unchanged_files_are_not_rewritten(sink, monkeypatch):
+    rendered = []
+    render = artifacts.render
+    monkeypatch.setattr(artifacts, "render", lambda artifact: rendered.append(artifact.path) or render(artifact))
+    with sink.batch():
+        sink.table([("fluency", 3)], ["criterion", "count"], "criteria.tex")
+        sink.json({"fluency": 3}, "criteria.json")
+    # Each file is rendered once, and the same bytes are hashed and written
+    assert sorted(rendered) == [os.path.join("Data", "criteria.json"), os.path.join("Tables", "criteria.tex")]
+    assert sink.write([artifacts.Artifact(os.path.join("Data", "criteria.json"), "json", {"fluency": 3})]) == 0
+    assert sink.write([artifacts.Artifact(os.path.join("Data", "criteria.json"), "json", {"fluency": 4})]) == 1
+
+
+def test_figures_go_through_the_sink(sink):
+    figure, ax = plt.subplots()
+    ax.bar(["all", "some", "none"], [3, 2, 1])
+    plt.close(figure)
+    assert sink.write([artifacts.Artifact(os.path.join("Figures", "plot.pdf"), "figure", figure)]) == 1
+    assert sink.write([artifacts.Artifact(os.path.join("Figures", "plot.pdf"), "figure", figure)]) == 0
+    assert os.path.getsize(os.path.join(sink.root, "Figures", "plot.pdf")) > 0
+
+
+def test_bundles_leave_figures_as_files(sink):
+    pytest.importorskip("pyarrow")
+    sink.bundle = "results.parquet"
+    figure, ax = plt.subplots()
+    plt.close(figure)
+    with sink.batch():
+        sink.table([("fluency", 3)], ["criterion", "count"], "criteria.tex")
+        sink.frame(pd.DataFrame({"a": [1]}), "a.xlsx")
+        sink.figure(figure, "plot.png")
+    bundle = pd.read_parquet(os.path.join(sink.root, "results.parquet"))
+    assert set(bundle["artifact"]) == {os.path.join("Tables", "criteria.tex"), os.path.join("Data", "a.xlsx")}
+    assert os.path.exists(os.path.join(sink.root, "Figures", "plot.png"))
@@ -0,0 +1,38 @@
+from collections import Counter, defaultdict
+import random
+
+import numpy as np
+from scipy import sparse
+
+from cooccurrence import Cooccurrence
+
+
+def test_ties_follow_first_occurrence_like_nested_counters():
+    rng = random.Random(0)
+    pairs = [(rng.choice("xyz"), rng.choice("abcdefgh")) for _ in range(200)]
+    nested = defaultdict(Counter)
+    for row_value, column_value in pairs:
+        nested[row_value][column_value] += 1
+    matrix = Cooccurrence.from_pairs([row for row, _ in pairs], [column for _, column in pairs])
+    for row_value, counter in nested.items():
+        assert matrix.top_k(row_value) == counter.most_common()
+        assert matrix.top_k(row_value, 3) == counter.most_common(3)
+    assert matrix.to_rows() == [[row_value, column_value, count] for row_value, counter in nested.items()
+                                for column_value, count in counter.most_common()]
+
+
+def test_ties_without_first_seen_are_in_column_order():
+    # The columns of each row are stored out of order
+    counts = sparse.csr_matrix((np.array([1, 3, 2, 3, 2, 1, 1, 1]), np.array([4, 3, 2, 1, 0, 4, 2, 1]),
+                                np.array([0, 5, 8])), shape=(2, 5))
+    matrix = Cooccurrence(counts, ["x", "y"], ["a", "b", "c", "d", "e"])
+    assert matrix.top_k("x") == [("b", 3), ("d", 3), ("a", 2), ("c", 2), ("e", 1)]
+    assert matrix.top_k("y") == [("b", 1), ("c", 1), ("e", 1)]
+
+
+def test_marginals():
+    matrix = Cooccurrence.from_pairs(["x", "x", "y"], ["a", "b", "a"])
+    assert matrix.row_totals().tolist() == [2, 1]
+    assert matrix.column_totals().tolist() == [2, 1]
+    assert matrix.count("x", "b") == 1
+    assert matrix.conditional_probability()[0, 0] == 0.5
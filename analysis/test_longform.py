@@ -0,0 +1,103 @@
+"""
+The long-form counters against the row-by-row loops they replaced.
+"""
+
+from collections import Counter
+import random
+import re
+
+import pytest
+
+from full_stats import (count_all_contents, count_contents, count_contents_paraphase, count_statistic,
+                        split_statistic, unique_count_contents)
+from longform import forget_long_form, long_form
+from sheetreader import COLUMNS, PaperIndex, Row
+
+CELLS = ["", "None given", "not given", "Blank", "English", " english ", "German", "Data-to-text generation",
+         "Multiple (list all): English, German", "multiple (list all): text: sentence, text: document",
+         "Multiple (list all): summarisation, data-to-text generation, ",
+         "Multiple (list all): a: b, c", "mean; median", "mean, standard deviation",
+         "21. Fluency", "--- 22b. Grammaticality", "59. Multiple (list all): 21. Fluency, 22. Grammaticality"]
+COUNTED = ["system_language", "system_output", "criterion_paraphrase", "op_statistics"]
+
+
+def loop_contents(value, key, count_blank=False):
+    "How the original loops split a cell."
+    value = value.lower()
+    if 'multiple' in value:
+        if key != "system_output":
+            value = " ".join(value.split(":")[1:])
+        else:
+            value = value.replace("multiple (list all):", "").strip()
+        return [item.strip() for item in value.strip().split(', ')]
+    elif value not in {"", "none given", "not given", "blank"}:
+        return [value.strip()]
+    elif count_blank:
+        return ["None Given/Blank"]
+    return []
+
+
+def loop_paraphrase(value):
+    "How the original loop split a paraphrase cell."
+    value = value.strip()
+    if 'Multiple' in value or 'multiple' in value:
+        value = " ".join(value.split(":")[1:])
+        value = value.replace("-", "").strip()
+        value = re.sub(r'(\d*\/*\d*\w\.) ', ' ', value)
+        return [item.strip() for item in value.strip().split(', ')]
+    elif value != "":
+        value = value.replace("-", "").strip()
+        return [re.sub(r'(\d*\/*\d*\w\.) ', ' ', value).strip()]
+    return []
+
+
+def random_index(seed, as_dicts=False):
+    rng = random.Random(seed)
+    index = {} if as_dicts else PaperIndex()
+    for paper in range(40):
+        rows = []
+        for _ in range(rng.randint(1, 4)):
+            values = {column: rng.choice(CELLS) if column in COUNTED else "" for column in COLUMNS}
+            rows.append(values if as_dicts else Row.from_values(values[column] for column in COLUMNS))
+        index[f"paper {paper}"] = rows
+    return index
+
+
+@pytest.fixture(params=[(seed, as_dicts) for seed in range(3) for as_dicts in (False, True)])
+def index(request):
+    index = random_index(*request.param)
+    yield index
+    forget_long_form(index)
+
+
+@pytest.mark.parametrize("key", COUNTED)
+def test_first_row_counts_match_the_loop(index, key):
+    for count_blank in (False, True):
+        expected = Counter(value for rows in index.values() for value in loop_contents(rows[0][key], key, count_blank))
+        assert count_contents(index, key, count_blank) == expected
+
+
+@pytest.mark.parametrize("key", COUNTED)
+def test_every_row_counts_match_the_loop(index, key):
+    unique = Counter(value for rows in index.values() for row in rows
+                     for value in set(loop_contents(row[key], key)))
+    every = Counter(value for rows in index.values() for row in rows
+                    for value in loop_contents(row[key], key, count_blank=True))
+    assert unique_count_contents(index, key) == unique
+    assert count_all_contents(index, key) == every
+
+
+def test_paraphrase_and_statistic_counts_match_the_loop(index):
+    paraphrases = Counter(value for rows in index.values() for value in loop_paraphrase(rows[0]["criterion_paraphrase"]))
+    statistics = Counter(value for rows in index.values() for value in split_statistic(rows[0]["op_statistics"]))
+    assert count_contents_paraphase(index, "criterion_paraphrase") == paraphrases
+    assert count_statistic(index, "op_statistics") == statistics
+
+
+def test_long_form_follows_changes_to_the_index():
+    index = random_index(0)
+    assert long_form(index) is long_form(index)
+    assert count_contents(index, "system_language")["klingon"] == 0
+    values = {column: "Klingon" if column == "system_language" else "" for column in COLUMNS}
+    index["new paper"] = [Row.from_values(values[column] for column in COLUMNS)]
+    assert count_contents(index, "system_language")["klingon"] == 1
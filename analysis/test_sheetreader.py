@@ -0,0 +1,51 @@
+import pickle
+
+import pytest
+
+from sheetreader import COLUMNS, PaperIndex, Row
+
+
+def make_row(**values):
+    return Row.from_values(values.get(column, "") for column in COLUMNS)
+
+
+def test_row_reads_columns_by_name():
+    row = make_row(criterion_verbatim="fluency")
+    assert row["criterion_verbatim"] == "fluency"
+    assert row.get("criterion_verbatim") == "fluency"
+    assert row[COLUMNS.index("criterion_verbatim")] == "fluency"
+
+
+def test_row_only_exposes_columns_as_keys():
+    row = make_row(criterion_verbatim="fluency")
+    for name in ["count", "index", "_fields", "_asdict", "missing"]:
+        assert name not in row
+        assert row.get(name) is None
+        assert row.get(name, "default") == "default"
+        with pytest.raises(KeyError):
+            row[name]
+
+
+def test_row_membership_is_about_keys_not_values():
+    row = make_row(criterion_verbatim="fluency")
+    assert "criterion_verbatim" in row
+    assert "fluency" not in row
+
+
+def test_row_behaves_like_the_dict_it_replaces():
+    values = {column: f"value {i}" for i, column in enumerate(COLUMNS)}
+    row = make_row(**values)
+    assert dict(row) == values
+    assert list(row.keys()) == list(values.keys())
+    assert list(row.values()) == list(values.values())
+    assert list(row.items()) == list(values.items())
+    assert list(row) == list(values.values())
+
+
+def test_paper_index_pickles_with_its_rows():
+    index = PaperIndex()
+    index["paper"].append(make_row(criterion_verbatim="fluency"))
+    restored = pickle.loads(pickle.dumps(index))
+    assert isinstance(restored, PaperIndex)
+    assert restored == index
+    assert restored["new paper"] == []
@@ -1,75 +1,488 @@
+import argparse
+import hashlib
+import json
 import os
 import popplerqt5
 import PyQt5
 import re
+import sys
+import threading
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    # Optional: used to find the pages with annotations without loading them in Poppler.
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
 
 
 PDF_DIR = "highlighted-pdfs/"
+CACHE_FILE = "extraction-cache.json"
+
+NEWLINE_RE = re.compile("\n")
+
+# Options for the extraction of a single PDF:
+# * text_mode: how the text under highlights is extracted
+#   - 'rect': ask Poppler for the text in each highlighted rectangle
+#   - 'boxes': get all words on the page once, and look the rectangles up in a spatial index
+# * prescan: whether to look for pages with annotations first, and only load those pages in Poppler
+# * render: whether to render region highlights to images, or only report their coordinates
+# * dpi: resolution of the rendered regions
+# * image_format: 'png', 'webp' or 'jpeg'
+# * quality: quality (for JPEG and WebP) or compression (for PNG) from 0 to 100; -1 uses Qt's default
+# * render_workers: number of threads rendering regions in the background
+ExtractionOptions = namedtuple('ExtractionOptions',
+                               ['text_mode', 'prescan', 'render', 'dpi', 'image_format', 'quality', 'render_workers'],
+                               defaults=['rect', True, True, 72 * 4, 'png', -1, 2])
+# Options that only change how the extraction is run, not its results; they are not part of the cache key.
+EXECUTION_OPTIONS = {'render_workers'}
+
+IMAGE_EXTENSIONS = {'png': 'png', 'webp': 'webp', 'jpeg': 'jpg'}
+
+# Height (in points) of the horizontal bands used by the spatial index of words on a page.
+BAND_HEIGHT = 12
+
+
+class TextBoxIndex(object):
+    """
+    Spatial index over the words on a page.
+    Words are bucketed into horizontal bands by their centre, so that looking up
+    a rectangle only has to check the words in the bands that it covers.
+    """
+    def __init__(self, page, band_height=BAND_HEIGHT):
+        self.band_height = band_height
+        self.bands = defaultdict(list)
+        for order, box in enumerate(page.textList()):
+            centre = box.boundingBox().center()
+            if box.hasSpaceAfter():
+                separator = ' '
+            elif box.nextWord() is None:
+                separator = '\n'
+            else:
+                separator = ''
+            word = (order, centre.x(), centre.y(), box.text(), separator)
+            self.bands[int(centre.y() // band_height)].append(word)
+
+    def text(self, x1, y1, x2, y2):
+        "Text of the words whose centre lies within the rectangle, in reading order."
+        x1, x2 = min(x1, x2), max(x1, x2)
+        y1, y2 = min(y1, y2), max(y1, y2)
+        words = []
+        for band in range(int(y1 // self.band_height), int(y2 // self.band_height) + 1):
+            words.extend(word for word in self.bands.get(band, ())
+                         if x1 <= word[1] <= x2 and y1 <= word[2] <= y2)
+        words.sort()
+        return ''.join(text + separator for _, _, _, text, separator in words).strip()
+
+
+def paper_key(filepath):
+    "The key of a paper is the name of its PDF, without the extension."
+    return os.path.splitext(os.path.basename(filepath))[0]
+
+
+def annotated_pages(filepath):
+    """
+    Indices of the pages that have an /Annots entry, read from the page dictionaries of the PDF.
+    Returns None if this cannot be determined (e.g. because pypdf is not installed).
+    """
+    if PdfReader is None:
+        return None
+    try:
+        reader = PdfReader(filepath)
+        pages = []
+        for i, page in enumerate(reader.pages):
+            annots = page.get('/Annots')
+            if annots is not None and len(annots.get_object()) > 0:
+                pages.append(i)
+        return pages
+    except Exception:
+        # Anything pypdf cannot parse is left to Poppler.
+        return None
+
 
+# Each rendering thread loads its own copy of the document, since Poppler documents are not thread-safe.
+_render_state = threading.local()
 
-def main(filepath):
+
+def render_region(filepath, page_number, boundary, image_path, options=ExtractionOptions()):
+    """
+    Render a region of a page, given as (x1, y1, x2, y2) fractions of the page size, and save it to `image_path`.
+    Returns whether the image was written.
+    """
+    if getattr(_render_state, 'filepath', None) != filepath:
+        _render_state.filepath = filepath
+        _render_state.doc = popplerqt5.Poppler.Document.load(filepath)
+    page = _render_state.doc.page(page_number)
+    (pwidth, pheight) = (page.pageSize().width(), page.pageSize().height())
+    (x1, y1, x2, y2) = boundary
+    scale = options.dpi / 72
+    qimage = page.renderToImage(options.dpi, options.dpi,
+                                x1 * pwidth * scale, y1 * pheight * scale,
+                                pwidth * (x2 - x1) * scale, pheight * (y2 - y1) * scale)
+    return qimage.save(image_path, options.image_format.upper(), options.quality)
+
+
+def iter_annotations(filepath, overwrite_images=False, options=ExtractionOptions()):
+    """
+    Extract the annotations from a single PDF, yielding one dictionary per annotation as soon as it is found.
+    Text highlights come with the highlighted text, and region highlights are written to image files.
+    Regions are rendered in background threads while the scan continues; a region's record (and the
+    records after it) are yielded once its image has been written, so the order of the records is kept.
+    Images are numbered in order, skipping regions whose image could not be saved (as the images of the
+    original script were). Region images that already exist are not rendered again, unless `overwrite_images` is set.
+    Coordinates are given in points, as [x1, y1, x2, y2] rectangles.
+    """
     doc = popplerqt5.Poppler.Document.load(filepath)
-    total_annotations = 0
+    key = paper_key(filepath)
+    # Images are numbered in order, counting only the images that were written (or kept).
     image_count = 0
-    for i in range(doc.numPages()):
-        #print("========= PAGE {} =========".format(i+1))
-        page = doc.page(i)
-        annotations = page.annotations()
-        (pwidth, pheight) = (page.pageSize().width(), page.pageSize().height())
-        if len(annotations) > 0:
-            for annotation in annotations:
-                if  isinstance(annotation, popplerqt5.Poppler.Annotation):
-                    total_annotations += 1
-                    if(isinstance(annotation, popplerqt5.Poppler.HighlightAnnotation)):
-                        quads = annotation.highlightQuads()
-                        txt = ""
-                        for quad in quads:
-                            rect = (quad.points[0].x() * pwidth,
-                                    quad.points[0].y() * pheight,
-                                    quad.points[2].x() * pwidth,
-                                    quad.points[2].y() * pheight)
-                            bdy = PyQt5.QtCore.QRectF()
-                            bdy.setCoords(*rect)
-                            txt = txt + str(page.text(bdy)) + ' '
-
-                        print("========= TEXT HIGHLIGHT =========")
-                        NEWLINE_RE = re.compile("\n")
-                        print(f"pg{i + 1} - {re.sub(NEWLINE_RE, ',', annotation.contents())} ({annotation.author()})")
-                        print(txt)
-                    elif isinstance(annotation, popplerqt5.Poppler.TextAnnotation):
-                        print("========= TEXTBOX =========")
-                        NEWLINE_RE = re.compile("\n")
-                        print(f"pg{i + 1} - {re.sub(NEWLINE_RE, ',', annotation.contents())} ({annotation.author()})")
-                    elif isinstance(annotation, popplerqt5.Poppler.GeomAnnotation):
-                        print("========= REGION HIGHLIGHT =========")
-                        NEWLINE_RE = re.compile("\n")
-                        print(f"pg{i + 1} - {re.sub(NEWLINE_RE, ',', annotation.contents())} ({annotation.author()})")
-                        boundary = annotation.boundary()
-                        x1 = boundary.left()
-                        y1 = boundary.top()
-                        x2 = boundary.right()
-                        y2 = boundary.bottom()
-                        qimage = page.renderToImage(72 * 4, 72 * 4,
-                                                    x1 * pwidth * 4, y1 * pheight * 4,
-                                                    pwidth * (x2 - x1) * 4, pheight * (y2 - y1) * 4)
-                        image_path = f"{os.path.basename(filepath)}.extracted_image{image_count}.png"
-                        write_success = qimage.save(image_path)
-                        if write_success:
-                            image_count += 1
-                            print(f"Region written to {image_path}")
-                        else:
-                            print(f"Could not save image!")
+    region_count = 0
+    extension = IMAGE_EXTENSIONS[options.image_format]
+
+    def image_path(number):
+        return f"{os.path.basename(filepath)}.extracted_image{number}.{extension}"
+
+    # Queue of (record, rendering job, path of the rendered image) triples that have not been yielded yet.
+    pending = deque()
+    renderer = None
+    pages = annotated_pages(filepath) if options.prescan else None
+    if pages is None or any(i >= doc.numPages() for i in pages):
+        pages = range(doc.numPages())
+    try:
+        for i in pages:
+            page = doc.page(i)
+            annotations = page.annotations()
+            (pwidth, pheight) = (page.pageSize().width(), page.pageSize().height())
+            text_index = None
+            if len(annotations) > 0:
+                for annotation in annotations:
+                    if  isinstance(annotation, popplerqt5.Poppler.Annotation):
+                        record = dict(paper=key,
+                                      page=i + 1,
+                                      type=None,
+                                      author=annotation.author(),
+                                      contents=annotation.contents(),
+                                      quads=[],
+                                      text=None,
+                                      image_path=None)
+                        job = rendered_path = None
+                        if(isinstance(annotation, popplerqt5.Poppler.HighlightAnnotation)):
+                            record['type'] = 'highlight'
+                            quads = annotation.highlightQuads()
+                            txt = ""
+                            for quad in quads:
+                                rect = (quad.points[0].x() * pwidth,
+                                        quad.points[0].y() * pheight,
+                                        quad.points[2].x() * pwidth,
+                                        quad.points[2].y() * pheight)
+                                if options.text_mode == 'boxes':
+                                    if text_index is None:
+                                        text_index = TextBoxIndex(page)
+                                    txt = txt + text_index.text(*rect) + ' '
+                                else:
+                                    bdy = PyQt5.QtCore.QRectF()
+                                    bdy.setCoords(*rect)
+                                    txt = txt + str(page.text(bdy)) + ' '
+                                record['quads'].append(list(rect))
+                            record['text'] = txt
+                        elif isinstance(annotation, popplerqt5.Poppler.TextAnnotation):
+                            record['type'] = 'textbox'
+                            boundary = annotation.boundary()
+                            record['quads'].append([boundary.left() * pwidth, boundary.top() * pheight,
+                                                    boundary.right() * pwidth, boundary.bottom() * pheight])
+                        elif isinstance(annotation, popplerqt5.Poppler.GeomAnnotation):
+                            record['type'] = 'region'
+                            boundary = annotation.boundary()
+                            x1 = boundary.left()
+                            y1 = boundary.top()
+                            x2 = boundary.right()
+                            y2 = boundary.bottom()
+                            record['quads'].append([x1 * pwidth, y1 * pheight, x2 * pwidth, y2 * pheight])
+                            if options.render:
+                                # With nothing being rendered, all earlier images are accounted for,
+                                # so the number of this region's image is known.
+                                if not pending and not overwrite_images and os.path.exists(image_path(image_count)):
+                                    record['image_path'] = image_path(image_count)
+                                    image_count += 1
+                                else:
+                                    # Rendered under a temporary name, and numbered once the earlier images are written
+                                    rendered_path = f"{os.path.basename(filepath)}.rendering{region_count}.{extension}"
+                                    region_count += 1
+                                    if renderer is None:
+                                        renderer = ThreadPoolExecutor(max_workers=options.render_workers)
+                                    job = renderer.submit(render_region, filepath, i, (x1, y1, x2, y2),
+                                                          rendered_path, options)
+                        pending.append((record, job, rendered_path))
+                        # Yield everything up to the first region that is still being rendered.
+                        while pending and (pending[0][1] is None or pending[0][1].done()):
+                            record, job, rendered_path = pending.popleft()
+                            image_count += finish_record(record, job, rendered_path, image_path(image_count))
+                            yield record
+        while pending:
+            record, job, rendered_path = pending.popleft()
+            image_count += finish_record(record, job, rendered_path, image_path(image_count))
+            yield record
+    finally:
+        if renderer is not None:
+            renderer.shutdown()
+
+
+def finish_record(record, job, rendered_path, image_path):
+    """
+    Wait for the rendering job of a record, if any. If the image was written, move it to `image_path`
+    and fill in its path. Returns whether an image was written.
+    """
+    if job is None:
+        return False
+    if not job.result():
+        if os.path.exists(rendered_path):
+            os.remove(rendered_path)
+        return False
+    os.replace(rendered_path, image_path)
+    record['image_path'] = image_path
+    return True
+
+
+def extract_annotations(filepath, overwrite_images=False, options=ExtractionOptions()):
+    """
+    Extract the annotations from a single PDF.
+    Returns a list of dictionaries, one per annotation, which can be sent between processes.
+    """
+    return list(iter_annotations(filepath, overwrite_images, options))
+
+
+################################################################################
+# Cache of extracted annotations, so that unchanged PDFs are not processed again.
+
+def file_hash(filepath):
+    "SHA-1 of the file contents, read in chunks."
+    sha = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def load_manifest(path):
+    "Load the cache manifest, which maps PDF filenames to their signature and annotation records."
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(manifest, path):
+    "Write the cache manifest, atomically."
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def options_key(options):
+    "The options that affect the extracted records, as stored in the manifest."
+    return [value for field, value in options._asdict().items() if field not in EXECUTION_OPTIONS]
+
+
+def cached_annotations(manifest, filepath, options=ExtractionOptions()):
+    """
+    Return the cached records for `filepath`, or None if the PDF has changed since they were extracted
+    (or they were extracted with different options).
+    A PDF is unchanged if its size and modification time are the same, or else if its contents hash the same.
+    Records whose region images have since been deleted are not used.
+    The manifest is not changed; cache_annotations() records the new modification time.
+    """
+    if not unchanged_since_extraction(manifest, filepath, options):
+        return None
+    entry = manifest[os.path.basename(filepath)]
+    if not all(os.path.exists(record['image_path']) for record in entry['records'] if record['image_path']):
+        return None
+    return entry['records']
+
+
+def unchanged_since_extraction(manifest, filepath, options=ExtractionOptions()):
+    """
+    Whether the manifest has an entry for `filepath` that was extracted, with the same options, from a PDF
+    with the same contents: the same size and modification time, or else the same hash.
+    """
+    entry = manifest.get(os.path.basename(filepath))
+    if entry is None or entry.get('options') != options_key(options):
+        return False
+    stat = os.stat(filepath)
+    if entry['size'] != stat.st_size:
+        return False
+    return entry['mtime'] == stat.st_mtime_ns or entry['sha1'] == file_hash(filepath)
+
+
+def cache_annotations(manifest, filepath, records, options=ExtractionOptions(), sha1=None):
+    "Store the records extracted from `filepath` in the manifest (`sha1` is the hash of the PDF, if known)."
+    stat = os.stat(filepath)
+    manifest[os.path.basename(filepath)] = dict(size=stat.st_size,
+                                                mtime=stat.st_mtime_ns,
+                                                sha1=sha1 or file_hash(filepath),
+                                                options=options_key(options),
+                                                records=records)
+
+
+def caching(manifest, filepath, records, options=ExtractionOptions()):
+    "Pass the records through, storing them in the manifest once they have all been extracted."
+    extracted = []
+    for record in records:
+        extracted.append(record)
+        yield record
+    cache_annotations(manifest, filepath, extracted, options)
+
+
+def print_annotations(records, render=True, outfile=sys.stdout):
+    "Print the annotations extracted from a single PDF. If regions were not rendered, print their coordinates."
+    banners = {'highlight': "TEXT HIGHLIGHT", 'textbox': "TEXTBOX", 'region': "REGION HIGHLIGHT"}
+    total_annotations = 0
+    for record in records:
+        total_annotations += 1
+        if record['type'] not in banners:
+            continue
+        print(f"========= {banners[record['type']]} =========", file=outfile)
+        print(f"pg{record['page']} - {re.sub(NEWLINE_RE, ',', record['contents'])} ({record['author']})", file=outfile)
+        if record['type'] == 'highlight':
+            print(record['text'], file=outfile)
+        elif record['type'] == 'region':
+            if not render:
+                print(f"Region at {record['quads'][0]}", file=outfile)
+            elif record['image_path'] is not None:
+                print(f"Region written to {record['image_path']}", file=outfile)
+            else:
+                print(f"Could not save image!", file=outfile)
 
     if total_annotations > 0:
-        print(str(total_annotations) + " annotation(s) found")
+        print(str(total_annotations) + " annotation(s) found", file=outfile)
     else:
-        print("no annotations found")
+        print("no annotations found", file=outfile)
+
+
+def write_jsonl(records, outfile, render=True):
+    """
+    Write annotations as JSON Lines, one record per line.
+    Every record is flushed as soon as it is written, so that consumers can start reading before extraction finishes.
+    Only records go to `outfile`; regions whose image could not be saved are reported on standard error.
+    """
+    for record in records:
+        outfile.write(json.dumps(record) + "\n")
+        outfile.flush()
+        if render and record['type'] == 'region' and record['image_path'] is None:
+            print(f"Could not save image of the region on page {record['page']} of {record['paper']}", file=sys.stderr)
+
+
+def extract_all(filepaths, workers=1, manifest=None, options=ExtractionOptions()):
+    """
+    Extract the annotations from several PDFs, yielding (filepath, records) pairs.
+    With more than one worker, documents are extracted in parallel processes,
+    but the results are still yielded in the order of `filepaths`.
+    With a single worker, `records` is a generator, so annotations are available as soon as they are found.
+    If a `manifest` is given, PDFs which are unchanged since the last run are not processed again,
+    and the records of the other PDFs are added to it.
+    """
+    if manifest is None:
+        cached = {}
+    else:
+        cached = {filepath: cached_annotations(manifest, filepath, options) for filepath in filepaths}
+        cached = {filepath: records for filepath, records in cached.items() if records is not None}
+        for filepath, records in cached.items():
+            # Keep the entry, but with the current modification time, so the PDF is not hashed again next time
+            cache_annotations(manifest, filepath, records, options, manifest[os.path.basename(filepath)]['sha1'])
+    todo = [filepath for filepath in filepaths if filepath not in cached]
+    # Existing region images are only reused if the manifest says they were rendered, with the same options,
+    # from the same PDF (e.g. when some of them were deleted); otherwise they may be stale, and are rendered again.
+    overwrite_images = [manifest is None or not unchanged_since_extraction(manifest, filepath, options)
+                        for filepath in todo]
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            extracted = executor.map(extract_annotations, todo, overwrite_images, [options] * len(todo))
+            for filepath in filepaths:
+                if filepath in cached:
+                    yield filepath, cached[filepath]
+                    continue
+                records = next(extracted)
+                if manifest is not None:
+                    cache_annotations(manifest, filepath, records, options)
+                yield filepath, records
+    else:
+        overwrite_images = dict(zip(todo, overwrite_images))
+        for filepath in filepaths:
+            if filepath in cached:
+                yield filepath, cached[filepath]
+                continue
+            records = iter_annotations(filepath, overwrite_images[filepath], options)
+            if manifest is not None:
+                records = caching(manifest, filepath, records, options)
+            yield filepath, records
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Dump the highlights and comments in the evidence PDFs.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes extracting PDFs in parallel (default: 1)")
+    parser.add_argument("--pdf-dir", default=PDF_DIR,
+                        help=f"directory containing the highlighted PDFs (default: {PDF_DIR})")
+    parser.add_argument("--format", choices=["text", "jsonl"], default="text",
+                        help="human-readable report, or one JSON record per annotation (default: text)")
+    parser.add_argument("--output", default="-",
+                        help="file to write the output to (default: standard output)")
+    parser.add_argument("--text-mode", choices=["rect", "boxes"], default="rect",
+                        help="extract highlighted text rectangle by rectangle, or from the words on "
+                             "the page gathered once per page; faster for heavily highlighted PDFs (default: rect)")
+    parser.add_argument("--no-prescan", action="store_true",
+                        help="load every page in Poppler, instead of only the pages with annotations")
+    parser.add_argument("--no-render", action="store_true",
+                        help="do not render region highlights, only report their coordinates")
+    parser.add_argument("--dpi", type=int, default=72 * 4,
+                        help="resolution of the rendered regions (default: 288)")
+    parser.add_argument("--image-format", choices=sorted(IMAGE_EXTENSIONS), default="png",
+                        help="file format of the rendered regions (default: png)")
+    parser.add_argument("--quality", type=int, default=-1,
+                        help="image quality (JPEG, WebP) or compression (PNG) from 0 to 100 (default: Qt's default)")
+    parser.add_argument("--render-workers", type=int, default=2,
+                        help="number of threads rendering regions for each PDF (default: 2)")
+    parser.add_argument("--cache", default=CACHE_FILE,
+                        help=f"manifest of previously extracted annotations (default: {CACHE_FILE})")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="process every PDF and render every region image again")
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    for fn in sorted([fn for fn in os.listdir(PDF_DIR) if fn.endswith(".pdf")]):
-        print(fn)
-        main(os.path.join(PDF_DIR, fn))
-        print()
-        print("----------------------------------------------------------------------------------------------")
-        print()
+    args = parse_args()
+    filepaths = [os.path.join(args.pdf_dir, fn)
+                 for fn in sorted([fn for fn in os.listdir(args.pdf_dir) if fn.endswith(".pdf")])]
+    options = ExtractionOptions(text_mode=args.text_mode,
+                                prescan=not args.no_prescan,
+                                render=not args.no_render,
+                                dpi=args.dpi,
+                                image_format=args.image_format,
+                                quality=args.quality,
+                                render_workers=args.render_workers)
+    if options.prescan and PdfReader is None:
+        # Said once here rather than by every worker: prescanning is skipped without pypdf.
+        print("pypdf is not installed, so every page is loaded in Poppler; "
+              "install pypdf to only load the pages with annotations (or pass --no-prescan)", file=sys.stderr)
+    manifest = None if args.no_cache else load_manifest(args.cache)
+    outfile = sys.stdout if args.output == "-" else open(args.output, "w")
+    for filepath, records in extract_all(filepaths, args.workers, manifest, options):
+        if args.format == "jsonl":
+            write_jsonl(records, outfile, options.render)
+            continue
+        print(os.path.basename(filepath), file=outfile)
+        print_annotations(records, options.render, outfile)
+        print(file=outfile)
+        print("----------------------------------------------------------------------------------------------", file=outfile)
+        print(file=outfile)
+    if outfile is not sys.stdout:
+        outfile.close()
+    if manifest is not None:
+        save_manifest(manifest, args.cache)
@@ -0,0 +1,314 @@
+"""
+Krippendorff's alpha for set-valued labels, computed with NumPy.
+
+This gives the same results as `nltk.metrics.agreement.AnnotationTask.alpha()`, but instead of computing
+the distance between every pair of labels over and over, each distinct label (set) is interned once,
+the distances between the distinct labels are computed once, and the observed and expected
+disagreement are computed from a matrix of label counts per item.
+"""
+
+import re
+from typing import Callable, Collection, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple, Union
+
+from nltk.metrics import binary_distance, jaccard_distance, masi_distance
+import numpy as np
+
+# Distance metrics that can be referred to by name.
+DISTANCES = {"jaccard": jaccard_distance,
+             "masi": masi_distance,
+             "binary": binary_distance}
+
+Metric = Union[str, Callable]
+
+# Number of bootstrap resamples computed by each task
+BOOTSTRAP_CHUNK_SIZE = 250
+
+
+class LabelSetVocabulary(object):
+    """
+    The distinct labels (usually frozensets of labels) used in one column, each with an integer code.
+    The distance matrix of each metric is kept, and only extended with the new labels when more labels
+    have been interned, so any number of metrics can be computed over the same labels,
+    and each distance is only computed once.
+    """
+
+    def __init__(self, distances: Optional[Dict[str, Callable]] = None):
+        self.labels = []
+        self.codes = {}
+        self.distances = dict(DISTANCES if distances is None else distances)
+        self._matrices = {}
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def intern(self, label: Hashable) -> int:
+        """The code of `label`, adding it to the vocabulary if it is new."""
+        code = self.codes.get(label)
+        if code is None:
+            code = self.codes[label] = len(self.labels)
+            self.labels.append(label)
+        return code
+
+    def distance_function(self, metric: Metric) -> Callable:
+        return self.distances[metric] if isinstance(metric, str) else metric
+
+    def distance(self, metric: Metric, label_a: Hashable, label_b: Hashable) -> float:
+        if label_a in self.codes and label_b in self.codes:
+            return self.distance_matrix(metric)[self.codes[label_a], self.codes[label_b]]
+        return self.distance_function(metric)(label_a, label_b)
+
+    def distance_matrix(self, metric: Metric) -> np.ndarray:
+        """
+        Distances between all pairs of labels: `matrix[i, j] == distance(metric, labels[i], labels[j])`.
+        The matrix is shared by later calls, so it is read-only.
+        """
+        matrix = self._matrices.get(metric)
+        if matrix is None:
+            matrix = distance_matrix(self.labels, self.distance_function(metric))
+        elif len(matrix) < len(self.labels):
+            matrix = extend_distance_matrix(matrix, self.labels, self.distance_function(metric))
+        else:
+            return matrix
+        matrix.flags.writeable = False
+        self._matrices[metric] = matrix
+        return matrix
+
+
+def distance_matrix(labels: Sequence[Hashable], distance: Callable) -> np.ndarray:
+    """
+    Distances between all pairs of distinct labels: `matrix[i, j] == distance(labels[i], labels[j])`.
+    The distance must be symmetric (as alpha requires): each pair is computed once, and the diagonal is 0.
+    """
+    matrix = np.zeros((len(labels), len(labels)))
+    for i, label_i in enumerate(labels):
+        for j in range(i + 1, len(labels)):
+            matrix[i, j] = distance(label_i, labels[j])
+    return matrix + matrix.T
+
+
+def extend_distance_matrix(matrix: np.ndarray, labels: Sequence[Hashable], distance: Callable) -> np.ndarray:
+    """`distance_matrix(labels, distance)`, reusing `matrix` for the labels it already covers."""
+    known = len(matrix)
+    extended = np.zeros((len(labels), len(labels)))
+    extended[:known, :known] = matrix
+    for j in range(known, len(labels)):
+        for i in range(j):
+            extended[i, j] = extended[j, i] = distance(labels[i], labels[j])
+    return extended
+
+
+def count_matrix(item_codes: np.ndarray, label_codes: np.ndarray, n_labels: int) -> np.ndarray:
+    """Matrix of how often each item (row) received each label (column)."""
+    n_items = item_codes.max() + 1 if len(item_codes) > 0 else 0
+    counts = np.bincount(item_codes * n_labels + label_codes, minlength=n_items * n_labels)
+    return counts.reshape(n_items, n_labels).astype(float)
+
+
+def alpha_from_counts(counts: np.ndarray, distances: np.ndarray) -> float:
+    """
+    Krippendorff's alpha from a matrix of label counts per item and a matrix of distances between labels.
+    Items with fewer than two labels are ignored, as in `nltk`.
+    """
+    labels_per_item = counts.sum(axis=1)
+    pairable = labels_per_item >= 2
+    counts = counts[pairable]
+    labels_per_item = labels_per_item[pairable]
+    label_totals = counts.sum(axis=0)
+    if np.count_nonzero(label_totals) == 1:
+        # Only one valid annotation value
+        return 1
+    # Observed disagreement: sum over items of (n_i . D . n_i) / (N_i - 1), divided by the number of pairable labels
+    within_item = np.einsum('ij,ij->i', counts @ distances, counts)
+    observed = (within_item / (labels_per_item - 1)).sum() / labels_per_item.sum()
+    # Expected disagreement, from the label totals over all pairable items
+    total = label_totals.sum()
+    expected = (label_totals @ distances @ label_totals) / (total * (total - 1))
+    return 1.0 - float(observed) / float(expected)
+
+
+class CodedAnnotations(object):
+    """
+    (coder, item, label) records converted to integer codes, with their labels interned in a vocabulary.
+    Extract the records once, and compute alpha for as many metrics as needed.
+    """
+
+    def __init__(self, records: Iterable[Tuple], vocabulary: Optional[LabelSetVocabulary] = None):
+        self.vocabulary = LabelSetVocabulary() if vocabulary is None else vocabulary
+        self.items, self.coders = {}, {}
+        item_codes, coder_codes, label_codes = [], [], []
+        for coder, item, label in records:
+            coder_codes.append(self.coders.setdefault(coder, len(self.coders)))
+            item_codes.append(self.items.setdefault(item, len(self.items)))
+            label_codes.append(self.vocabulary.intern(label))
+        self.item_codes = np.array(item_codes, dtype=int)
+        self.coder_codes = np.array(coder_codes, dtype=int)
+        self.label_codes = np.array(label_codes, dtype=int)
+        self.counts = count_matrix(self.item_codes, self.label_codes, len(self.vocabulary))
+
+    def alpha(self, metric: Metric) -> float:
+        """Krippendorff's alpha, as computed by `nltk`'s `AnnotationTask.alpha()`."""
+        labels_used = len(np.unique(self.label_codes))
+        # Degenerate cases, handled in the same way as in `nltk`
+        if labels_used == 0:
+            raise ValueError("Cannot calculate alpha, no data present!")
+        if labels_used == 1:
+            return 1
+        if len(self.coders) == 1 and len(self.items) == 1:
+            raise ValueError("Cannot calculate alpha, only one coder and item present!")
+        return alpha_from_counts(self.label_counts(), self.vocabulary.distance_matrix(metric))
+
+    def label_counts(self) -> np.ndarray:
+        """Label counts per item, with a column for every label in the vocabulary (which may be shared and have grown)."""
+        counts = np.zeros((self.counts.shape[0], len(self.vocabulary)))
+        counts[:, :self.counts.shape[1]] = self.counts
+        return counts
+
+
+def krippendorff_alpha(records: Sequence[Tuple], distance: Metric) -> float:
+    """Krippendorff's alpha for (coder, item, label) records, as computed by `nltk`'s `AnnotationTask.alpha()`."""
+    return CodedAnnotations(records).alpha(distance)
+
+
+def bootstrap_alpha_chunk(counts: np.ndarray, distances: Sequence[np.ndarray], n_resamples: int,
+                     seed: np.random.SeedSequence) -> np.ndarray:
+    """Alpha for `n_resamples` resamples (with replacement) of the items (rows of `counts`), for each distance matrix."""
+    rng = np.random.default_rng(seed)
+    n_items = counts.shape[0]
+    alphas = np.empty((n_resamples, len(distances)))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for i in range(n_resamples):
+            resample = counts[rng.integers(0, n_items, n_items)]
+            for j, distance in enumerate(distances):
+                alphas[i, j] = alpha_from_counts(resample, distance)
+    return alphas
+
+
+def bootstrap_chunks(n_resamples: int, seed: Union[int, np.random.SeedSequence, None],
+                     chunk_size: int = BOOTSTRAP_CHUNK_SIZE) -> List[Tuple[int, np.random.SeedSequence]]:
+    """
+    Split `n_resamples` into chunks, each with its own independent random stream spawned from `seed`.
+    The chunks do not depend on the number of workers, so results are reproducible however they are run.
+    """
+    sizes = [min(chunk_size, n_resamples - start) for start in range(0, n_resamples, chunk_size)]
+    seed = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    return list(zip(sizes, seed.spawn(len(sizes))))
+
+
+class HierarchyIndex(object):
+    """
+    Ancestors and depth of every label in a hierarchy of labels, computed once, so that the tree distance
+    between two labels is a lookup rather than a walk up the tree.
+    The hierarchy is given as {family: [family, member, member, ...]} (as in the schemes' `HIERARCHY_DICT`),
+    or as {label: parent} for deeper trees. Labels are matched ignoring case and any leading
+    dashes and numbering ('--- 15b. '); labels that are not in the hierarchy are roots of their own.
+    Cells listing several labels ('59. Multiple (list all): 21. Fluency, 22. Grammaticality') are split.
+    """
+
+    PREFIX_RE = re.compile(r"^[-\s]*(?:[\d/]+[a-z]*\.\s+)?")
+    MULTIPLE_RE = re.compile(r"^multiple[^:]*:")
+    SEPARATOR_RE = re.compile(r"[,;]")
+
+    def __init__(self, parents: Dict[str, Optional[str]]):
+        self.parents = {self.canonical(label): self.canonical(parent) if parent else None
+                        for label, parent in parents.items()}
+        self.ancestors = {}
+        for label in self.parents:
+            chain = [label]
+            while self.parents.get(chain[-1]) is not None and self.parents[chain[-1]] not in chain:
+                chain.append(self.parents[chain[-1]])
+            # Depth of each ancestor (including the label itself), counting the top-level families as 1
+            self.ancestors[label] = {ancestor: len(chain) - i for i, ancestor in enumerate(chain)}
+        self.depths = {label: ancestors[label] for label, ancestors in self.ancestors.items()}
+        self.max_depth = max(self.depths.values(), default=1)
+        # Longest labels first, so that e.g. 'Detectability of controlled feature [PROPERTY] (specify): ...'
+        # is matched to the most specific label it starts with
+        self._by_length = sorted(self.ancestors, key=len, reverse=True)
+        # Memos for the cells and pairs of nodes seen so far (every label in the hierarchy is its own node)
+        self._nodes = {label: label for label in self.ancestors}
+        self._cells = {}
+        self._distances = {}
+
+    @classmethod
+    def from_families(cls, families: Dict[str, Collection[str]]) -> "HierarchyIndex":
+        parents = {}
+        for family, members in families.items():
+            parents.setdefault(family, None)
+            for member in members:
+                if member != family:
+                    parents.setdefault(member, family)
+        return cls(parents)
+
+    @classmethod
+    def canonical(cls, label: str) -> str:
+        return cls.PREFIX_RE.sub("", str(label)).strip().casefold()
+
+    def node(self, label: Hashable) -> str:
+        """The label in the hierarchy that `label` refers to, or its canonical form if it is not in the hierarchy."""
+        node = self._nodes.get(label)
+        if node is None:
+            node = self._nodes[label] = self._find_node(self.canonical(label))
+        return node
+
+    def _find_node(self, canonical: str) -> str:
+        if canonical in self.ancestors:
+            return canonical
+        for known in self._by_length:
+            if canonical.startswith(known):
+                return known
+        return canonical
+
+    def nodes(self, label: Hashable) -> Tuple[str, ...]:
+        """The labels in the hierarchy that a cell refers to: one, or several for a 'Multiple' cell."""
+        nodes = self._cells.get(label)
+        if nodes is None:
+            canonical = self.canonical(label)
+            if not self.MULTIPLE_RE.match(canonical):
+                nodes = (self.node(label),)
+            else:
+                listed = self.SEPARATOR_RE.split(self.MULTIPLE_RE.sub("", canonical))
+                nodes = tuple(dict.fromkeys(self.node(item) for item in listed if self.canonical(item)))
+            self._cells[label] = nodes
+        return nodes
+
+    def depth(self, node: str) -> int:
+        return self.depths.get(node, 1)
+
+    def family(self, label: str) -> str:
+        """The top-level family of a node (the node itself if it is not in the hierarchy)."""
+        ancestors = self.ancestors.get(label, {label: 1})
+        return min(ancestors, key=ancestors.get)
+
+    def label_distance(self, node_a: str, node_b: str) -> float:
+        """Path length between two nodes through their deepest common ancestor, scaled to [0, 1]."""
+        if node_a == node_b:
+            return 0.0
+        distance = self._distances.get((node_a, node_b))
+        if distance is None:
+            ancestors_a = self.ancestors.get(node_a, {node_a: 1})
+            ancestors_b = self.ancestors.get(node_b, {node_b: 1})
+            common_depth = max((ancestors_a[ancestor] for ancestor in ancestors_a.keys() & ancestors_b.keys()),
+                               default=0)
+            distance = (self.depth(node_a) + self.depth(node_b) - 2 * common_depth) / (2 * self.max_depth)
+            self._distances[node_a, node_b] = self._distances[node_b, node_a] = distance
+        return distance
+
+    def __call__(self, labels_a: Collection[Hashable], labels_b: Collection[Hashable]) -> float:
+        """
+        Distance between two sets of labels: the mean distance from each label to the closest label in the
+        other set, averaged over both directions. For single labels this is the tree distance.
+        """
+        labels_a = self.expand(labels_a)
+        labels_b = self.expand(labels_b)
+        if not labels_a or not labels_b:
+            return 0.0 if len(labels_a) == len(labels_b) else 1.0
+        a_to_b = sum(min(self.label_distance(a, b) for b in labels_b) for a in labels_a) / len(labels_a)
+        b_to_a = sum(min(self.label_distance(a, b) for a in labels_a) for b in labels_b) / len(labels_b)
+        return (a_to_b + b_to_a) / 2
+
+    def collapse(self, labels: Collection[Hashable]) -> frozenset:
+        """The set of top-level families of `labels`."""
+        return frozenset(self.family(node) for node in self.expand(labels))
+
+    def expand(self, labels: Collection[Hashable]) -> List[str]:
+        """The nodes referred to by a set of cells."""
+        return list(dict.fromkeys(node for label in labels for node in self.nodes(label)))
@@ -1,11 +1,43 @@
-from typing import Collection, Dict, List, Optional, Tuple
+from typing import Collection, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
-from nltk.metrics.agreement import AnnotationTask
-from nltk.metrics import jaccard_distance, masi_distance
+from agreement import CodedAnnotations, HierarchyIndex, LabelSetVocabulary, bootstrap_alpha_chunk, bootstrap_chunks
+
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import csv
+import hashlib
+import io
+import json
+import re
+import threading
+import time
 
 import gspread
+import numpy as np
+from openpyxl import load_workbook
 import os
 import pandas as pd
+import requests
+
+ANNOTATION_SHEET = "Annotation Sheet"
+# Value in the key column that marks the end of the annotations in a sheet
+END_OF_DOC = "END_OF_DOC"
+GOOGLE_SHEET_URL_RE = re.compile(r"https://docs\.google\.com/spreadsheets/d/([\w-]+)")
+# Sheet (tab) ID in a Google Sheets URL, e.g. ".../edit#gid=123"
+GOOGLE_SHEET_GID_RE = re.compile(r"[#?&]gid=(\d+)")
+# Distance metrics (see `agreement.DISTANCES`) for which alpha is computed by default
+ALPHA_METRICS = ("jaccard", "masi")
+# Key of the Parquet metadata entry with the size, modification time and SHA-1 of the CSV file a typed cache was written from
+CSV_STAT_KEY = b"iaa_source_csv"
+
+
+def file_hash(filepath: str) -> str:
+    """SHA-1 of the file contents, read in chunks."""
+    sha = hashlib.sha1()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
 
 
 def extract_iaa_df_by_column_name(annotation_df: pd.DataFrame, column_name: str) -> pd.DataFrame:
@@ -20,6 +52,46 @@ def extract_records_for_nltk(iaa_df: pd.DataFrame) -> List[Tuple]:
     return [(b, c, d) for _, b, c, d in iaa_df.to_records()]
 
 
+def absolute_agreement_matrix(iaa_df: pd.DataFrame, column_name: str, metric: str = "jaccard",
+                              vocabulary: Optional[LabelSetVocabulary] = None) -> pd.DataFrame:
+    """
+    Annotator x annotator matrix of the mean agreement (1 - distance) between the label sets two annotators
+    gave to the same paper, over the papers both of them annotated.
+    `iaa_df` is produced by `extract_iaa_df_by_column_name()`; it is pivoted to a paper x annotator matrix
+    of interned label sets once, and all pairs of annotators are compared at the same time.
+    """
+    vocabulary = LabelSetVocabulary() if vocabulary is None else vocabulary
+    by_paper = iaa_df.pivot(index='key', columns='source_spreadsheet', values=column_name)
+    # Label set codes, with `len(vocabulary)` standing for "not annotated"
+    codes = by_paper.apply(lambda labels: labels.map(vocabulary.intern, na_action='ignore'))
+    n_labels = len(vocabulary)
+    codes = codes.fillna(n_labels).to_numpy(dtype=int)
+    similarity = np.zeros((n_labels + 1, n_labels + 1))
+    similarity[:n_labels, :n_labels] = 1 - vocabulary.distance_matrix(metric)
+    annotated = codes < n_labels
+
+    # (paper, annotator, annotator) similarities, only counting papers annotated by both annotators
+    pair_similarity = similarity[codes[:, :, None], codes[:, None, :]]
+    both_annotated = annotated[:, :, None] & annotated[:, None, :]
+    shared_papers = both_annotated.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        agreement = pair_similarity.sum(axis=0) / shared_papers
+    return pd.DataFrame(agreement, index=by_paper.columns.rename(None), columns=by_paper.columns.rename(None))
+
+
+def rows_until(rows: Iterable[List[str]], sentinel: Optional[str] = END_OF_DOC) -> Iterator[List[str]]:
+    """The rows before the first row whose first cell is `sentinel` (all rows if there is none, or no sentinel)."""
+    for row in rows:
+        if sentinel is not None and row and row[0] == sentinel:
+            return
+        yield row
+
+
+def is_transient_status(status: int) -> bool:
+    """Whether an HTTP status means the same request may succeed later (rate limiting or a server error)."""
+    return status == 429 or 500 <= status < 600
+
+
 def pretty_print_iaa_by_column(iaa_by_column_dict, values=("alpha_jaccard", "alpha_masi")):
     print(f"column\t{'  '.join(values)}")
     for column in iaa_by_column_dict:
@@ -27,6 +99,181 @@ def pretty_print_iaa_by_column(iaa_by_column_dict, values=("alpha_jaccard", "alp
         print(f"{column}\t{values_string}")
 
 
+class SheetSource(ABC):
+    """Somewhere to load the annotation sheets from: each sheet is returned as a list of rows of strings."""
+
+    # Errors after which it may be worth trying to load the sheet again (see `is_retryable()`).
+    RETRYABLE_ERRORS = ()
+
+    @abstractmethod
+    def get_all_values(self, location: str) -> List[List[str]]:
+        """The rows of the annotation sheet at `location`."""
+
+    def is_retryable(self, error: Exception) -> bool:
+        """Whether loading the sheet again may succeed after `error`: errors of HTTP requests are only retried
+        if the request was rate limited (429) or failed on the server (5xx), or if there was no response at all."""
+        if not isinstance(error, self.RETRYABLE_ERRORS):
+            return False
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+        return status is None or is_transient_status(status)
+
+
+class GoogleSheetSource(SheetSource):
+    """Annotation sheets on Google Sheets, identified by their URL."""
+
+    RETRYABLE_ERRORS = (gspread.exceptions.APIError, requests.exceptions.RequestException)
+
+    def __init__(self, client: Optional[gspread.Client] = None):
+        self._client = client
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> gspread.Client:
+        # Only log in when a sheet is actually requested, so that importing this module does not need the network.
+        # Sheets may be requested from several threads, which all share the same client (and HTTP session).
+        with self._lock:
+            if self._client is None:
+                # Generate pop-up to log in through Google.
+                # If the pop-up has previously been generated,
+                # this will instead use the existing authorization.
+                self._client = gspread.oauth()
+        return self._client
+
+    def get_all_values(self, url: str) -> List[List[str]]:
+        # Just the first sheet contains the annotations
+        # There is a second sheet in each spreadsheet which contains the 'backing data',
+        # i.e. the valid labels for closed-class categories in the annotation sheet
+        return self.client.open_by_url(url).worksheet(ANNOTATION_SHEET).get_all_values()
+
+
+class HTTPSheetSource(SheetSource):
+    """
+    Annotation sheets downloaded as CSV over a shared HTTP session.
+    Google Sheets URLs are turned into CSV export URLs; any other URL should return CSV itself
+    (e.g. a local stand-in server). For private sheets, pass an authorised session.
+    A CSV export only contains one sheet (tab), identified by its gid rather than its name: the gid in the URL
+    (e.g. `.../edit#gid=123`) if there is one, else `gid`. The default, 0, is the first tab, which is where
+    the annotation sheet is in the IAA spreadsheets; `GoogleSheetSource` opens the "Annotation Sheet" tab by name instead.
+    """
+
+    RETRYABLE_ERRORS = (requests.exceptions.RequestException,)
+
+    def __init__(self, session: Optional[requests.Session] = None, timeout: float = 30, gid: int = 0):
+        self.session = session if session is not None else requests.Session()
+        self.timeout = timeout
+        self.gid = gid
+
+    def export_url(self, url: str) -> str:
+        match = GOOGLE_SHEET_URL_RE.match(url)
+        if match is None:
+            return url
+        gid_match = GOOGLE_SHEET_GID_RE.search(url)
+        gid = gid_match.group(1) if gid_match is not None else self.gid
+        return f"https://docs.google.com/spreadsheets/d/{match.group(1)}/export?format=csv&gid={gid}"
+
+    def get_all_values(self, url: str) -> List[List[str]]:
+        response = self.session.get(self.export_url(url), timeout=self.timeout)
+        response.raise_for_status()
+        return [row for row in csv.reader(io.StringIO(response.content.decode("utf-8")))]
+
+
+class CachedSheetSource(SheetSource):
+    """
+    Wraps another source and keeps a local CSV copy of every sheet it loads, in `cache_dir`.
+    Sheets that are in the cache are not loaded again, unless their copy is older than `max_age` seconds
+    (by default, copies never expire) or `refresh` is set, in which case every sheet is loaded again once
+    and its copy replaced. Deleting a file (or the directory) also refreshes the sheets.
+    """
+
+    def __init__(self, source: SheetSource, cache_dir: str, max_age: Optional[float] = None, refresh: bool = False):
+        self.source = source
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.refresh = refresh
+        self.RETRYABLE_ERRORS = source.RETRYABLE_ERRORS
+        # Locations loaded again by this source, so that `refresh` only loads each sheet once
+        self._refreshed = set()
+
+    def cache_path(self, location: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(location.encode("utf-8")).hexdigest() + ".csv")
+
+    def is_retryable(self, error: Exception) -> bool:
+        return self.source.is_retryable(error)
+
+    def is_fresh(self, location: str) -> bool:
+        """Whether there is a copy of the sheet at `location` that can be used."""
+        path = self.cache_path(location)
+        if not os.path.exists(path):
+            return False
+        if self.refresh and location not in self._refreshed:
+            return False
+        return self.max_age is None or time.time() - os.path.getmtime(path) <= self.max_age
+
+    def get_all_values(self, location: str) -> List[List[str]]:
+        path = self.cache_path(location)
+        if self.is_fresh(location):
+            with open(path, newline="") as f:
+                return [row for row in csv.reader(f)]
+        values = self.source.get_all_values(location)
+        self._refreshed.add(location)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", newline="") as f:
+            csv.writer(f).writerows(values)
+        os.replace(tmp_path, path)
+        return values
+
+
+def get_all_values_with_retry(source: SheetSource, location: str, retries: int = 3, backoff: float = 1.0) -> List[List[str]]:
+    """
+    Load a sheet, trying again after `backoff`, `2 * backoff`, ... seconds if it fails with a retryable error
+    (see `SheetSource.is_retryable()`). Other errors, e.g. a missing sheet or no permission to read it, are raised at once.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return source.get_all_values(location)
+        except source.RETRYABLE_ERRORS as error:
+            if attempt == retries or not source.is_retryable(error):
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+
+class LocalSheetSource(SheetSource):
+    """
+    Exported snapshots of the annotation sheets (XLSX, ODS or CSV files).
+    Sheets are identified by their path, or by a URL that is mapped to a path in `paths`.
+    CSV and XLSX files are streamed row by row; with `stop_at`, reading stops at the first row
+    whose first cell has that value (e.g. END_OF_DOC), so rows below it are never parsed.
+    """
+
+    def __init__(self, paths: Optional[Dict[str, str]] = None, sheet_name: str = ANNOTATION_SHEET,
+                 stop_at: Optional[str] = None):
+        self.paths = dict(paths or {})
+        self.sheet_name = sheet_name
+        self.stop_at = stop_at
+
+    def get_all_values(self, location: str) -> List[List[str]]:
+        path = self.paths.get(location, location)
+        return list(rows_until(self.iter_values(path), self.stop_at))
+
+    def iter_values(self, path: str) -> Iterator[List[str]]:
+        if path.lower().endswith(".csv"):
+            with open(path, newline="") as f:
+                yield from csv.reader(f)
+        elif path.lower().endswith((".xlsx", ".xlsm")):
+            workbook = load_workbook(path, read_only=True, data_only=True)
+            try:
+                for row in workbook[self.sheet_name].iter_rows(values_only=True):
+                    yield ["" if value is None else str(value) for value in row]
+            finally:
+                workbook.close()
+        else:
+            # ODS files (which need `odfpy`) cannot be streamed
+            sheet = pd.read_excel(path, sheet_name=self.sheet_name, header=None, dtype=str, na_filter=False)
+            yield from sheet.fillna("").values.tolist()
+
+
 class IAASpreadsheetScheme(object):
     CLOSED_CLASS_COLUMNS = None
     OPEN_CLASS_COLUMNS = None
@@ -35,32 +282,137 @@ class IAASpreadsheetScheme(object):
     ALL_COLUMNS = None
 
     HIERARCHY_DICT = None
+    # Column whose labels are organised in `HIERARCHY_DICT`
+    HIERARCHY_COLUMN = "criterion_paraphrase"
+
+    # Where annotation sheets are loaded from by default.
+    # The Google session is only opened when the first sheet is requested.
+    SHEET_SOURCE = GoogleSheetSource()
 
-    # Generate pop-up to log in through Google.
-    # If the pop-up has previously been generated,
-    # this will instead use the existing authorization.
-    google_session = gspread.oauth()
+    # Bump this whenever the way annotation dataframes are prepared changes, to invalidate cached copies.
+    CACHE_SCHEMA_VERSION = 1
+
+    @classmethod
+    def categorical_columns(cls) -> List[str]:
+        """Columns stored as categoricals in the typed cache (by default, the closed-class columns)."""
+        return list(cls.CLOSED_CLASS_COLUMNS or [])
+
+    @classmethod
+    def cache_path(cls, filepath: str) -> str:
+        """
+        Location of the typed (Parquet) cache for the dataframe stored in `filepath`.
+        The name includes a fingerprint of the scheme, so a cache written by another scheme
+        (or by a version with different columns) is never read.
+        """
+        schema = repr((cls.__name__, cls.CACHE_SCHEMA_VERSION, cls.ALL_COLUMNS, cls.categorical_columns()))
+        fingerprint = hashlib.sha1(schema.encode("utf-8")).hexdigest()[:10]
+        return f"{os.path.splitext(filepath)[0]}.{cls.__name__}-{fingerprint}.parquet"
+
+    @classmethod
+    def typed_df(cls, annotation_df: pd.DataFrame) -> pd.DataFrame:
+        """Drop the index column written by earlier versions of `to_csv()` and make closed-class columns categorical."""
+        annotation_df = annotation_df.drop(columns="Unnamed: 0", errors="ignore")
+        for column in cls.categorical_columns():
+            if column in annotation_df.columns:
+                annotation_df[column] = annotation_df[column].astype("category")
+        return annotation_df
+
+    @classmethod
+    def read_typed_cache(cls, filepath: str) -> Optional[pd.DataFrame]:
+        """
+        The annotations from the typed cache for `filepath`, or None if there is no cache
+        or it was not written from the current CSV file.
+        As for the paper index cache of the analysis (`analysis/sheetreader.py`), the cache records the size,
+        modification time and SHA-1 of the CSV file. It is valid if the size and modification time are unchanged,
+        or, if only the modification time changed (e.g. after a checkout), the contents are the same.
+        """
+        try:
+            import pyarrow.parquet as pq
+            table = pq.read_table(cls.cache_path(filepath))
+        except (ImportError, OSError, ValueError):
+            return None
+        csv_stat = json.loads((table.schema.metadata or {}).get(CSV_STAT_KEY, b"null"))
+        if not csv_stat:
+            return None
+        stat = os.stat(filepath)
+        if csv_stat["size"] != stat.st_size:
+            return None
+        # Parquet does not keep the dtype of empty categoricals, so the closed-class columns are converted again.
+        annotation_df = cls.typed_df(table.to_pandas())
+        if csv_stat["mtime"] != stat.st_mtime_ns:
+            if csv_stat["sha1"] != file_hash(filepath):
+                return None
+            # Same contents: remember the new modification time so the next load skips hashing.
+            cls.write_typed_cache(filepath, annotation_df, csv_stat["sha1"])
+        return annotation_df
 
-    _GOOGLE_SESSION = gspread.oauth()
+    @classmethod
+    def write_typed_cache(cls, filepath: str, annotation_df: pd.DataFrame, sha1: Optional[str] = None) -> None:
+        """Write the typed cache for the CSV file at `filepath`, atomically, recording the size, mtime and SHA-1 of the CSV."""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            # Parquet needs pyarrow; without it, we just read the CSV file every time.
+            return
+        stat = os.stat(filepath)
+        csv_stat = dict(size=stat.st_size, mtime=stat.st_mtime_ns, sha1=sha1 or file_hash(filepath))
+        table = pa.Table.from_pandas(annotation_df, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                               CSV_STAT_KEY: json.dumps(csv_stat).encode("utf-8")})
+        cache_path = cls.cache_path(filepath)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            pq.write_table(table, tmp_path)
+            os.replace(tmp_path, cache_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
 
     @classmethod
-    def load_locally_fallback_to_web(cls, filepath: str, urls: Collection[str]) -> pd.DataFrame:
-        if os.path.exists(filepath):
-            annotation_df = pd.read_csv(filepath)
+    def load_locally_fallback_to_web(cls, filepath: str, urls: Collection[str],
+                                     source: Optional[SheetSource] = None) -> pd.DataFrame:
+        """
+        Load the annotations from the CSV file at `filepath`, else from the sheets at `urls`
+        (and write them to `filepath`).
+        The CSV file is the primary copy: the parsed dataframe is kept in a typed (Parquet) cache next to it,
+        which is only used while it matches the CSV file, and is rebuilt from the CSV file otherwise.
+        """
+        if not os.path.exists(filepath):
+            cls.prepare_df_from_google_sheets(urls, source).to_csv(filepath, index=False)
         else:
-            annotation_df = cls.prepare_df_from_google_sheets(urls)
-            annotation_df.to_csv(filepath)
+            annotation_df = cls.read_typed_cache(filepath)
+            if annotation_df is not None:
+                return annotation_df
+        # Always parse the CSV file, so the result (and the cache) is the same whichever way it was loaded.
+        annotation_df = cls.typed_df(pd.read_csv(filepath))
+        cls.write_typed_cache(filepath, annotation_df)
         return annotation_df
 
+    # Number of sheets that are loaded at the same time.
+    FETCH_WORKERS = 8
+
     @classmethod
-    def prepare_df_from_google_sheets(cls, url_collection: Collection[str]) -> pd.DataFrame:
-        spreadsheets = map(cls._GOOGLE_SESSION.open_by_url, url_collection)
+    def fetch_sheets(cls, url_collection: Collection[str], source: Optional[SheetSource] = None,
+                     retries: int = 3, backoff: float = 1.0) -> List[List[List[str]]]:
+        """
+        Load the rows of each annotation sheet from `source` (by default, `SHEET_SOURCE`).
+        Sheets are loaded concurrently, and retried with exponential backoff if loading them fails;
+        they are returned in the order of `url_collection`.
+        """
+        if source is None:
+            source = cls.SHEET_SOURCE
+        url_collection = list(url_collection)
+        if len(url_collection) == 0:
+            return []
+        with ThreadPoolExecutor(max_workers=min(cls.FETCH_WORKERS, len(url_collection))) as executor:
+            return list(executor.map(lambda url: get_all_values_with_retry(source, url, retries, backoff),
+                                     url_collection))
 
-        # Just the first sheet contains the annotations
-        # There is a second sheet in each spreadsheet which contains the 'backing data',
-        # i.e. the valid labels for closed-class categories in the annotation sheet
-        annotation_sheets = [spreadsheet.worksheet("Annotation Sheet") for spreadsheet in spreadsheets]
-        data = [sheet.get_all_values() for sheet in annotation_sheets]
+    @classmethod
+    def prepare_df_from_google_sheets(cls, url_collection: Collection[str],
+                                      source: Optional[SheetSource] = None) -> pd.DataFrame:
+        data = cls.fetch_sheets(url_collection, source)
 
         # The first two rows contain header information, so we drop this from the data we have loaded from each spreadsheet.
         for sheet in data:
@@ -84,7 +436,7 @@ class IAASpreadsheetScheme(object):
         annotation_df = pd.DataFrame(annotation_df.to_records())
 
         # Drop the unnecessary within-spreadsheet index from the full dataset
-        annotation_df = annotation_df.drop("level_1", 1)
+        annotation_df = annotation_df.drop(columns="level_1")
 
         # Give the which-spreadsheet-did-it-come-from column a sensible name
         annotation_df.rename(columns={"level_0": "source_spreadsheet"},
@@ -94,40 +446,112 @@ class IAASpreadsheetScheme(object):
         return annotation_df
 
     @classmethod
-    def run_closed_class_jaccard_and_masi(cls, df: pd.DataFrame) -> Dict:
+    def run_closed_class_jaccard_and_masi(cls, df: pd.DataFrame, metrics: Sequence[str] = ALPHA_METRICS) -> Dict:
         iaa_by_column = {column: {"df": extract_iaa_df_by_column_name(df, column)} for column in cls.CLOSED_CLASS_COLUMNS}
 
         for column in iaa_by_column:
-            task = AnnotationTask(distance=jaccard_distance)
-            task.load_array(extract_records_for_nltk(iaa_by_column[column]['df']))
-            iaa_by_column[column]['alpha_jaccard'] = task.alpha()
-
-            task = AnnotationTask(distance=masi_distance)
-            task.load_array(extract_records_for_nltk(iaa_by_column[column]['df']))
-            iaa_by_column[column]['alpha_masi'] = task.alpha()
+            # Same results as nltk's AnnotationTask.alpha(), but the records are extracted once per column,
+            # and the label sets and the distances between them are shared by all metrics
+            annotations = CodedAnnotations(extract_records_for_nltk(iaa_by_column[column]['df']))
+            iaa_by_column[column]['annotations'] = annotations
+            for metric in metrics:
+                iaa_by_column[column][f'alpha_{metric}'] = annotations.alpha(metric)
         return iaa_by_column
 
     @classmethod
-    def print_absolute_agreement(cls, dataframe: pd.DataFrame, iaa_by_column_dict: Optional[Dict] = None) -> None:
+    def hierarchy_index(cls) -> HierarchyIndex:
+        """Index of the ancestors and depth of every label in `HIERARCHY_DICT`, built once per scheme."""
+        if cls.__dict__.get("_hierarchy_index") is None:
+            cls._hierarchy_index = HierarchyIndex.from_families(cls.HIERARCHY_DICT)
+        return cls._hierarchy_index
+
+    @classmethod
+    def run_hierarchical_agreement(cls, df: pd.DataFrame, metrics: Sequence[str] = ALPHA_METRICS,
+                                   iaa_by_column_dict: Optional[Dict] = None) -> Dict:
+        """
+        Agreement on `HIERARCHY_COLUMN` that takes `HIERARCHY_DICT` into account:
+        `alpha_hierarchy` scores disagreements by the distance between the labels in the hierarchy,
+        and `alpha_parent_<metric>` is alpha after collapsing every label to its top-level family.
+        """
+        if iaa_by_column_dict is None:
+            iaa_by_column_dict = cls.run_closed_class_jaccard_and_masi(df, metrics)
+        column = iaa_by_column_dict[cls.HIERARCHY_COLUMN]
+        index = cls.hierarchy_index()
+        results = {"alpha_hierarchy": column['annotations'].alpha(index)}
+        parent_annotations = CodedAnnotations((coder, item, index.collapse(labels))
+                                              for coder, item, labels in extract_records_for_nltk(column['df']))
+        for metric in metrics:
+            results[f'alpha_parent_{metric}'] = parent_annotations.alpha(metric)
+        return results
+
+    @classmethod
+    def bootstrap_closed_class_alpha(cls, df: pd.DataFrame, metrics: Sequence[str] = ALPHA_METRICS,
+                                     n_resamples: int = 1000, confidence: float = 0.95, seed: Optional[int] = 0,
+                                     workers: Optional[int] = None,
+                                     iaa_by_column_dict: Optional[Dict] = None) -> pd.DataFrame:
+        """
+        Alpha for each closed-class column and metric, with a percentile bootstrap confidence interval over papers.
+        The resamples are split into chunks with independent random streams spawned from `seed`,
+        and computed in `workers` processes (or in this process if `workers` is 1).
+        The same `seed` gives the same intervals, whatever the number of workers.
+        Returns a DataFrame indexed by (column, metric), with the columns alpha, ci_lower and ci_upper.
+        """
+        if iaa_by_column_dict is None:
+            iaa_by_column_dict = cls.run_closed_class_jaccard_and_masi(df, metrics)
+        chunks = bootstrap_chunks(n_resamples, seed)
+        tasks = {}
+        for column in cls.CLOSED_CLASS_COLUMNS:
+            annotations = iaa_by_column_dict[column]['annotations']
+            distances = [annotations.vocabulary.distance_matrix(metric) for metric in metrics]
+            tasks[column] = [(annotations.label_counts(), distances, size, chunk_seed) for size, chunk_seed in chunks]
+
+        if workers == 1:
+            alphas = {column: [bootstrap_alpha_chunk(*task) for task in column_tasks] for column, column_tasks in tasks.items()}
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {column: [executor.submit(bootstrap_alpha_chunk, *task) for task in column_tasks]
+                           for column, column_tasks in tasks.items()}
+                alphas = {column: [future.result() for future in column_futures]
+                          for column, column_futures in futures.items()}
+
+        tail = (1 - confidence) / 2 * 100
+        rows = []
+        for column in cls.CLOSED_CLASS_COLUMNS:
+            resampled = np.concatenate(alphas[column])
+            lower, upper = np.nanpercentile(resampled, [tail, 100 - tail], axis=0)
+            for i, metric in enumerate(metrics):
+                rows.append((column, metric, iaa_by_column_dict[column][f'alpha_{metric}'], lower[i], upper[i]))
+        return pd.DataFrame(rows, columns=["column", "metric", "alpha", "ci_lower", "ci_upper"]) \
+            .set_index(["column", "metric"])
+
+    @classmethod
+    def absolute_agreement(cls, dataframe: pd.DataFrame, iaa_by_column_dict: Optional[Dict] = None,
+                           metric: str = "jaccard") -> Dict[str, pd.DataFrame]:
+        """Annotator x annotator agreement matrix (see `absolute_agreement_matrix()`) for each closed-class column."""
         if iaa_by_column_dict is None:
             iaa_by_column_dict = cls.run_closed_class_jaccard_and_masi(dataframe)
+        annotators = dataframe.source_spreadsheet.unique()
+        agreement_by_column = {}
         for column in cls.CLOSED_CLASS_COLUMNS:
-            df = iaa_by_column_dict[column]['df']
+            annotations = iaa_by_column_dict[column].get('annotations')
+            vocabulary = annotations.vocabulary if annotations is not None else None
+            agreement_by_column[column] = absolute_agreement_matrix(
+                iaa_by_column_dict[column]['df'], column, metric=metric, vocabulary=vocabulary
+            ).reindex(index=annotators, columns=annotators)
+        return agreement_by_column
+
+    @classmethod
+    def print_absolute_agreement(cls, dataframe: pd.DataFrame, iaa_by_column_dict: Optional[Dict] = None) -> None:
+        for column, agreement in cls.absolute_agreement(dataframe, iaa_by_column_dict).items():
             print(f"Interannotator agreement for {column}")
-            annotator_list = dataframe.source_spreadsheet.unique()
-            print(" \t" + "\t".join([str(annotator) for annotator in annotator_list]))
-            for a1 in annotator_list:
-                a1_vals = list(df[df.source_spreadsheet == a1][column])
-                print(f"{a1}", end="\t")
-                pairwise_agreements = []
-                for a2 in annotator_list:
-                    a2_vals = list(df[df.source_spreadsheet == a2][column])
-                    agreement_sum = 0
-                    for a1_val, a2_val in zip(a1_vals, a2_vals):
-                        agreement_sum += 1 - jaccard_distance(a1_val, a2_val)
-                    pairwise_agreements.append(agreement_sum / min(len(a1_vals), len(a2_vals)))
-                    print(f"{pairwise_agreements[-1]:.2f}", end="\t")
-                print(f"\t{(sum(pairwise_agreements) - 1) / (len(pairwise_agreements) - 1):.2f}")
+            print(" \t" + "\t".join([str(annotator) for annotator in agreement.columns]))
+            for annotator, row in agreement.iterrows():
+                print(f"{annotator}", end="\t")
+                print("\t".join(f"{value:.2f}" for value in row), end="\t")
+                # Mean agreement with all the others, leaving out the agreement of 1 with themselves
+                # (pairs of annotators without papers in common count as 0). The row is summed left to right,
+                # as it always was: NumPy's pairwise sum can round means such as 0.525 the other way.
+                print(f"\t{(sum(row.fillna(0).tolist()) - 1) / (len(row) - 1):.2f}")
             print()
             print()
 
@@ -279,7 +703,7 @@ class IAAv2SpreadsheetScheme(IAASpreadsheetScheme):
                            "Text Property [Complexity/simplicity]",
                            "Text Property [Complexity/simplicity (form)]",
                            "Text Property [Complexity/simplicity (content)]",
-                           "Text Property [Complexity/simplicity (both form and content)]"
+                           "Text Property [Complexity/simplicity (both form and content)]",
                            "Feature-type criteria assessed looking at outputs and inputs",
                            "Detectability of controlled feature [PROPERTY]",
                            "Feature-type criteria assessed looking at outputs and external frame of reference",
@@ -313,24 +737,13 @@ class IAAv2ecSpreadsheetScheme(IAAv2SpreadsheetScheme):
     ALL_COLUMNS = METADATA_COLUMNS + ALL_DATA_COLUMNS
 
     @classmethod
-    def prepare_df_from_google_sheets(cls, url_collection: Collection[str]) -> pd.DataFrame:
-        spreadsheets = map(cls._GOOGLE_SESSION.open_by_url, url_collection)
-
-        # Just the first sheet contains the annotations
-        # There is a second sheet in each spreadsheet which contains the 'backing data',
-        # i.e. the valid labels for closed-class categories in the annotation sheet
-        annotation_sheets = [spreadsheet.worksheet("Annotation Sheet") for spreadsheet in spreadsheets]
-        data = [sheet.get_all_values() for sheet in annotation_sheets]
+    def prepare_df_from_google_sheets(cls, url_collection: Collection[str],
+                                      source: Optional[SheetSource] = None) -> pd.DataFrame:
+        data = cls.fetch_sheets(url_collection, source)
 
         # The first two rows contain header information, so we drop this from the data we have loaded from each spreadsheet.
-        end_of_doc_index = []
-        for sheet in data:
-            sections = sheet.pop(0)
-            headers = sheet.pop(0)
-            # Only read data in until the first column has a value "END_OF_DOC"
-            keys = [row[0] for row in sheet]
-            end_of_doc_index.append(keys.index('END_OF_DOC'))
-        data = [sheet[:end_of_doc_index[i]] for i, sheet in enumerate(data)]
+        # Only read data in until the first column has a value "END_OF_DOC"
+        data = [list(rows_until(sheet[2:], END_OF_DOC)) for sheet in data]
 
         dataframes = [pd.DataFrame(sheet) for sheet in data]
 
@@ -352,7 +765,7 @@ class IAAv2ecSpreadsheetScheme(IAAv2SpreadsheetScheme):
         annotation_df = pd.DataFrame(annotation_df.to_records())
 
         # Drop the unnecessary within-spreadsheet index from the full dataset
-        annotation_df = annotation_df.drop("level_1", 1)
+        annotation_df = annotation_df.drop(columns="level_1")
 
         # Give the which-spreadsheet-did-it-come-from column a sensible name
         annotation_df.rename(columns={"level_0": "source_spreadsheet"},
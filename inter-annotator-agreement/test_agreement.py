@@ -0,0 +1,88 @@
+import pickle
+import random
+
+from nltk.metrics import binary_distance, jaccard_distance, masi_distance
+from nltk.metrics.agreement import AnnotationTask
+import numpy as np
+import pytest
+
+from agreement import CodedAnnotations, HierarchyIndex, LabelSetVocabulary, distance_matrix, krippendorff_alpha
+
+FAMILIES = {"Correctness of outputs": ["Correctness of outputs", "Grammaticality", "Spelling accuracy"],
+            "Fluency": ["Fluency"]}
+
+LABELS = ["fluency", "grammaticality", "coherence", "accuracy"]
+
+
+def random_records(seed, n_coders=4, n_items=30):
+    rng = random.Random(seed)
+    records = []
+    for item in range(n_items):
+        for coder in range(n_coders):
+            if rng.random() < 0.8:
+                labels = frozenset(rng.sample(LABELS, rng.randint(1, 2)))
+                records.append((f"coder {coder}", f"item {item}", labels))
+    return records
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("metric, distance", [("jaccard", jaccard_distance), ("masi", masi_distance),
+                                              ("binary", binary_distance)])
+def test_alpha_matches_nltk(seed, metric, distance):
+    records = random_records(seed)
+    task = AnnotationTask(distance=distance)
+    task.load_array(records)
+    assert krippendorff_alpha(records, metric) == pytest.approx(task.alpha(), abs=1e-12)
+
+
+def test_alpha_metrics_share_one_extraction():
+    records = random_records(0)
+    annotations = CodedAnnotations(records)
+    for metric in ["jaccard", "masi", "jaccard"]:
+        assert annotations.alpha(metric) == pytest.approx(krippendorff_alpha(records, metric), abs=1e-12)
+
+
+def test_distance_matrix_is_symmetric_with_a_zero_diagonal():
+    labels = [frozenset({"b"}), frozenset({"a"}), frozenset({"a", "b"}), frozenset({"c"})]
+    matrix = distance_matrix(labels, jaccard_distance)
+    expected = np.array([[0.0 if i == j else jaccard_distance(a, b) for j, b in enumerate(labels)]
+                         for i, a in enumerate(labels)])
+    np.testing.assert_array_equal(matrix, expected)
+
+
+def test_hierarchy_distances():
+    index = HierarchyIndex.from_families(FAMILIES)
+    assert index.label_distance("grammaticality", "grammaticality") == 0.0
+    assert index.label_distance("grammaticality", "spelling accuracy") == 0.5
+    assert index.label_distance("grammaticality", "correctness of outputs") == 0.25
+    assert index.label_distance("grammaticality", "fluency") == 0.75
+    assert index.label_distance("fluency", "grammaticality") == 0.75
+    assert index({"21. Grammaticality"}, {"--- 22. Spelling accuracy"}) == 0.5
+
+
+def test_hierarchy_cells():
+    index = HierarchyIndex.from_families(FAMILIES)
+    assert index.nodes("59. Multiple (list all): 21. Fluency, 22. Grammaticality") == ("fluency", "grammaticality")
+    assert index.node("Grammaticality (of the sentence)") == "grammaticality"
+    assert index.node("Unknown label") == "unknown label"
+    assert index.collapse({"Grammaticality", "Spelling accuracy"}) == frozenset({"correctness of outputs"})
+
+
+def test_hierarchy_index_memos_are_per_instance():
+    index = HierarchyIndex.from_families(FAMILIES)
+    index({"Grammaticality"}, {"Fluency"})
+    other = HierarchyIndex.from_families({"Fluency": ["Fluency", "Grammaticality"]})
+    assert other.label_distance("grammaticality", "fluency") == 0.25
+    assert pickle.loads(pickle.dumps(index)).label_distance("grammaticality", "fluency") == 0.75
+
+
+def test_vocabulary_extends_its_distance_matrix():
+    vocabulary = LabelSetVocabulary()
+    labels = [frozenset({"a"}), frozenset({"a", "b"}), frozenset({"c"}), frozenset({"b", "c"})]
+    for label in labels[:2]:
+        vocabulary.intern(label)
+    vocabulary.distance_matrix("masi")
+    for label in labels[2:]:
+        vocabulary.intern(label)
+    np.testing.assert_array_equal(vocabulary.distance_matrix("masi"), distance_matrix(labels, masi_distance))
+    assert vocabulary.distance("masi", labels[0], labels[3]) == masi_distance(labels[0], labels[3])
@@ -0,0 +1,64 @@
+import csv
+import os
+
+import pandas as pd
+import pytest
+
+from iaa_utilities import IAAv2SpreadsheetScheme, LocalSheetSource
+
+pytest.importorskip("pyarrow")
+
+
+def write_sheet(path, rows):
+    columns = IAAv2SpreadsheetScheme.ALL_COLUMNS
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["section"] * len(columns))
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([row.get(column, "") for column in columns])
+
+
+@pytest.fixture
+def sheets(tmp_path):
+    paths = []
+    for annotator in ["A", "B"]:
+        path = tmp_path / f"sheet-{annotator}.csv"
+        write_sheet(path, [dict(key="P1", annotator=annotator, pub_year="2020", system_task="summarisation",
+                                criterion_paraphrase="Fluency"),
+                           dict(key="P2", annotator=annotator, pub_year="2019", system_task="data-to-text generation",
+                                criterion_paraphrase="Grammaticality", time_taken="35 mins")])
+        paths.append(str(path))
+    return paths
+
+
+def test_web_and_csv_loads_give_the_same_typed_frame(tmp_path, sheets):
+    scheme = IAAv2SpreadsheetScheme
+    filepath = str(tmp_path / "iaa.csv")
+    from_web = scheme.load_locally_fallback_to_web(filepath, sheets, LocalSheetSource())
+    assert os.path.exists(scheme.cache_path(filepath))
+
+    from_cache = scheme.load_locally_fallback_to_web(filepath, sheets, LocalSheetSource())
+    pd.testing.assert_frame_equal(from_web, from_cache)
+
+    os.remove(scheme.cache_path(filepath))
+    from_csv = scheme.load_locally_fallback_to_web(filepath, sheets, LocalSheetSource())
+    pd.testing.assert_frame_equal(from_web, from_csv)
+    assert from_csv["criterion_paraphrase"].dtype == "category"
+
+
+def test_typed_cache_is_only_used_for_the_csv_it_was_written_from(tmp_path, sheets):
+    scheme = IAAv2SpreadsheetScheme
+    filepath = str(tmp_path / "iaa.csv")
+    annotation_df = scheme.load_locally_fallback_to_web(filepath, sheets, LocalSheetSource())
+    pd.testing.assert_frame_equal(scheme.read_typed_cache(filepath), annotation_df)
+
+    # Same contents, new modification time: the cache is still valid.
+    stat = os.stat(filepath)
+    os.utime(filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    pd.testing.assert_frame_equal(scheme.read_typed_cache(filepath), annotation_df)
+
+    # Changed contents: the cache is stale.
+    with open(filepath, "a") as f:
+        f.write("\n")
+    assert scheme.read_typed_cache(filepath) is None